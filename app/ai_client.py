@@ -54,6 +54,11 @@ class AIClient:
             self.anthropic_client = anthropic.Anthropic(api_key=self.anthropic_key)
             logging.info("AI: Anthropic Driver Loaded.")
 
+        # 4. Opt-in: replay identical requests from the local response cache
+        self.response_cache_enabled = os.getenv("RESPONSE_CACHE", "").lower() in ("1", "true", "yes", "on")
+        if self.response_cache_enabled:
+            logging.info("AI: Response cache enabled.")
+
     def set_model(self, model_name):
         self.model_name = model_name
         
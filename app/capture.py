@@ -1,115 +1,232 @@
 import os
 import logging
+import threading
 from datetime import datetime
-from PIL import ImageGrab, ImageDraw, ImageFont
-from PyQt6.QtWidgets import QApplication
-
-def get_timestamped_path():
-    if not os.path.exists("captures"):
-        os.makedirs("captures")
-        logging.info("Created captures directory")
-    path = os.path.join("captures", f"q_{datetime.now().strftime('%H%M%S')}.png")
-    logging.info(f"Generated path: {path}")
-    return path
-
-def capture_screen_with_overlay(overlay_widget):
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, ImageGrab
+from PyQt6.QtCore import Qt, QRect
+from PyQt6.QtGui import QImage, QPainter, QPixmap, QRegion
+from PyQt6.QtWidgets import QApplication, QWidget
+
+from .capture_store import CaptureStore, write_png
+
+# --- BACKGROUND ENCODER ---
+# One worker keeps saves ordered; PIL releases the GIL while compressing.
+_encoder = ThreadPoolExecutor(max_workers=1, thread_name_prefix="capture-encoder")
+_pending = {}  # {abs_path: Future} for captures not yet on disk
+_pending_lock = threading.Lock()
+
+store = CaptureStore()
+
+# User exports (Ctrl+S) live outside the store, so retention never touches them
+EXPORT_DIR = "exports"
+
+class PendingCapture:
     """
-    Captures the screen using PIL and draws overlay elements on top.
-    Uses the approach from backup.py that was working.
+    Handle to a composited capture whose file is still being written.
+    `path` is final from the start; `result()` blocks until the bytes are on
+    disk and returns the path, or None if the save failed.
     """
-    logging.info("Starting screen capture with PIL...")
-    
-    # Hide the overlay to capture clean screen
-    overlay_widget.hide()
-    QApplication.processEvents()
-    
-    # Capture screen with PIL
-    screenshot = ImageGrab.grab(all_screens=True)
+    def __init__(self, path, image, future):
+        self.path = path
+        self.image = image
+        self.future = future
+
+    def done(self):
+        return self.future.done()
+
+    def result(self, timeout=None):
+        try:
+            self.future.result(timeout)
+            return self.path
+        except Exception as e:
+            logging.error(f"Capture save failed for {self.path}: {e}")
+            return None
+
+    def preview(self, width=400):
+        """Thumbnail straight from memory, so the chat can show it before the save lands."""
+        thumb = self.image.copy()
+        thumb.thumbnail((width, width * 10))
+        thumb = thumb.convert("RGB")
+        data = thumb.tobytes("raw", "RGB")
+        qimage = QImage(data, thumb.width, thumb.height, thumb.width * 3, QImage.Format.Format_RGB888)
+        return QPixmap.fromImage(qimage.copy())
+
+def _track(path, future):
+    """Registers a queued save for wait_for_capture() until it finishes."""
+    with _pending_lock:
+        _pending[path] = future
+
+    def _forget(_):
+        with _pending_lock:
+            if _pending.get(path) is future:
+                del _pending[path]
+    future.add_done_callback(_forget)
+
+def save_capture_async(image, path):
+    """Queues `image` to be written to `path` and returns a PendingCapture immediately."""
+    future = _encoder.submit(write_png, image, path)
+    _track(path, future)
+    return PendingCapture(path, image, future)
+
+def store_capture(image):
+    """
+    Files a composited capture in the store. The path is a fresh name known
+    right away; hashing the pixels for dedup happens on the encoder thread
+    along with the encode, so the GUI never touches the full grab.
+    """
+    path = store.new_path()
+    future = _encoder.submit(store.put, image, path)
+    _track(path, future)
+    return PendingCapture(path, image, future)
+
+def export_path():
+    """Stable, timestamped path for a user export; microseconds keep quick repeats apart."""
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    name = f"canvas_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.png"
+    return os.path.abspath(os.path.join(EXPORT_DIR, name))
+
+def schedule_retention(referenced_paths):
+    """Runs store retention on the encoder thread, after any queued saves."""
+    def _run():
+        store.enforce_retention(referenced_paths)
+        stats = store.stats()
+        logging.info(f"Capture store: {stats['files']} file(s), {stats['bytes']} bytes "
+                     f"(limit {stats['max_bytes']})")
+    return _encoder.submit(_run)
+
+def wait_for_capture(path, timeout=None):
+    """Blocks until a capture queued for `path` has been written. Returns False if it failed."""
+    with _pending_lock:
+        future = _pending.get(path)
+    if future is None:
+        return True
+    try:
+        future.result(timeout)
+        return True
+    except Exception as e:
+        logging.error(f"Capture save failed for {path}: {e}")
+        return False
+
+def capture_crop_rect(overlay_widget):
+    """
+    Overlay-space rect the capture should be cut down to, or None to keep
+    every monitor. A dragged region wins; otherwise, with auto-crop on, the
+    union of annotations and textboxes plus the configured margin. Textboxes
+    alone (usually just the prompt) never trigger a crop.
+    """
+    canvas = overlay_widget.painter
+    if canvas.region is not None:
+        return QRect(canvas.region)
+
+    state = overlay_widget.tool_state
+    if not state.auto_crop:
+        return None
+
+    bounds = canvas.content_bounds()
+    if bounds.isNull():
+        # Nothing drawn: the user is asking about the whole screen
+        return None
+    for textbox in getattr(overlay_widget, 'textboxes', []):
+        if textbox.text().strip():
+            bounds = bounds.united(textbox.geometry())
+
+    m = state.crop_margin
+    return bounds.adjusted(-m, -m, m, m).intersected(overlay_widget.rect())
+
+def render_overlay_image(overlay_widget, scale=1.0, source_rect=None):
+    """
+    Renders the committed annotations and textboxes into a transparent QImage,
+    exactly as they appear on the overlay. `source_rect` limits the render to
+    that part of the overlay.
+    """
+    if source_rect is None:
+        source_rect = overlay_widget.rect()
+    image = QImage(round(source_rect.width() * scale), round(source_rect.height() * scale),
+                   QImage.Format.Format_ARGB32_Premultiplied)
+    image.fill(Qt.GlobalColor.transparent)
+
+    painter = QPainter(image)
+    painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+    painter.scale(scale, scale)
+    painter.translate(-source_rect.x(), -source_rect.y())
+
+    canvas = overlay_widget.painter
+    if scale == 1.0:
+        # The tile cache already holds these pixels, just blit it
+        canvas.layer.paint(painter, source_rect)
+    else:
+        # Scaling cached tiles would blur them on HiDPI grabs; replay vectors instead
+        for item in canvas.strokes:
+            canvas._draw_item(painter, item)
+
+    for textbox in getattr(overlay_widget, 'textboxes', []):
+        if textbox.text().strip():
+            # Background + text only; the hover delete button is a child widget
+            textbox.render(painter, textbox.pos(), QRegion(), QWidget.RenderFlag.DrawWindowBackground)
+
+    painter.end()
+    return image
+
+def qimage_to_pil(image):
+    """Copies a QImage into a non-premultiplied RGBA PIL image."""
+    image = image.convertToFormat(QImage.Format.Format_RGBA8888)
+    ptr = image.constBits()
+    ptr.setsize(image.sizeInBytes())
+    return Image.frombuffer("RGBA", (image.width(), image.height()), bytes(ptr),
+                            "raw", "RGBA", image.bytesPerLine(), 1)
+
+def grab_screen():
+    """Grabs every monitor. Call this before the overlay is shown."""
+    frame = ImageGrab.grab(all_screens=True)
+    logging.info(f"Screen pre-grabbed: {frame.size}")
+    return frame
+
+def capture_screen_with_overlay(overlay_widget, frame=None, path=None):
+    """
+    Composites the overlay's own rendering (cached annotation tiles +
+    textboxes) onto a screen grab in a single alpha blend.
+    `frame` is the clean grab taken before the overlay opened; without it
+    the overlay has to be hidden and the screen grabbed now. With `path`
+    the result is written there instead of the capture store.
+    """
+    if frame is not None:
+        screenshot = frame
+    else:
+        logging.info("No pre-grabbed frame, hiding overlay for a live grab...")
+        overlay_widget.hide()
+        QApplication.processEvents()
+        screenshot = ImageGrab.grab(all_screens=True)
     logging.info(f"Screenshot captured: {screenshot.size}")
     
-    draw = ImageDraw.Draw(screenshot)
+    # The grab is in physical pixels of the whole virtual desktop
+    screen = overlay_widget.screen()
+    dpr = screen.devicePixelRatio()
+    virtual = screen.virtualGeometry()
+    geo = overlay_widget.geometry()
+    offset = (max(0, round((geo.x() - virtual.x()) * dpr)),
+              max(0, round((geo.y() - virtual.y()) * dpr)))
     
-    # Draw the strokes/lines from the painter
-    strokes_drawn = 0
-    if hasattr(overlay_widget, 'painter') and hasattr(overlay_widget.painter, 'strokes'):
-        for stroke in overlay_widget.painter.strokes:
-            if stroke.get("type") == "stroke" and len(stroke.get('points', [])) > 1:
-                # Convert QPoint to tuples for PIL
-                points = [(p.x(), p.y()) for p in stroke['points']]
-                color = stroke['color']
-                width = stroke.get('size', 3)
-                # Convert QColor to RGB tuple
-                rgb_color = (color.red(), color.green(), color.blue())
-                draw.line(points, fill=rgb_color, width=width)
-                strokes_drawn += 1
-            elif stroke.get("type") == "shape":
-                # Draw shapes
-                color = stroke['color']
-                rgb_color = (color.red(), color.green(), color.blue())
-                width = stroke.get('size', 3)
-                start = stroke.get('start')
-                end = stroke.get('end')
-                
-                if start and end:
-                    shape_type = stroke.get('shape')
-                    # Draw based on shape type (Rectangle, Circle, Line, Arrow)
-                    # For simplicity, drawing as lines for now
-                    x1, y1 = start.x(), start.y()
-                    x2, y2 = end.x(), end.y()
-                    
-                    # Rectangle
-                    if hasattr(shape_type, 'name') and 'RECTANGLE' in shape_type.name:
-                        draw.rectangle([x1, y1, x2, y2], outline=rgb_color, width=width)
-                    # Circle  
-                    elif hasattr(shape_type, 'name') and 'CIRCLE' in shape_type.name:
-                        draw.ellipse([x1, y1, x2, y2], outline=rgb_color, width=width)
-                    # Line or Arrow (simplified)
-                    else:
-                        draw.line([(x1, y1), (x2, y2)], fill=rgb_color, width=width)
-                    
-                    strokes_drawn += 1
-        
-        logging.info(f"Drew {strokes_drawn} strokes/shapes")
-    
-    # Draw text boxes
-    textboxes_drawn = 0
-    if hasattr(overlay_widget, 'textboxes'):
-        for textbox in overlay_widget.textboxes:
-            text = textbox.text()
-            if text.strip():
-                tx, ty = textbox.x(), textbox.y()
-                tw, th = textbox.width(), textbox.height()
-                
-                # Draw background
-                draw.rectangle([tx, ty, tx+tw, ty+th], fill=(50, 50, 70, 200))
-                
-                # Draw text
-                font_size = max(12, int(th * 0.5))
-                try:
-                    font = ImageFont.truetype("arial.ttf", font_size)
-                except:
-                    try:
-                        font = ImageFont.truetype("segoeui.ttf", font_size)
-                    except:
-                        font = ImageFont.load_default()
-                
-                draw.text((tx+10, ty+(th-font_size)//2), text, fill=(255, 255, 255), font=font)
-                textboxes_drawn += 1
-        
-        logging.info(f"Drew {textboxes_drawn} text boxes")
-    
-    # Save the screenshot
-    path = get_timestamped_path()
-    screenshot.save(path)
-    
-    abs_path = os.path.abspath(path)
-    
-    if os.path.exists(abs_path):
-        size = os.path.getsize(abs_path)
-        logging.info(f"Screenshot saved successfully to: {abs_path}")
-        logging.info(f"File size: {size} bytes")
+    crop = capture_crop_rect(overlay_widget)
+    if crop is not None and not crop.isEmpty():
+        # Cut the grab down first so encoding and upload only see the crop
+        left = offset[0] + round(crop.x() * dpr)
+        top = offset[1] + round(crop.y() * dpr)
+        screenshot = screenshot.crop((left, top,
+                                      left + round(crop.width() * dpr),
+                                      top + round(crop.height() * dpr)))
+        overlay = qimage_to_pil(render_overlay_image(overlay_widget, dpr, crop))
+        offset = (0, 0)
+        logging.info(f"Cropped capture to {screenshot.size}")
     else:
-        logging.error(f"Screenshot save failed - file not found at: {abs_path}")
-        abs_path = None
+        overlay = qimage_to_pil(render_overlay_image(overlay_widget, dpr))
+
+    screenshot = screenshot.convert("RGBA")
+    screenshot.alpha_composite(overlay, dest=offset)
+    screenshot = screenshot.convert("RGB")
+    logging.info(f"Composited {len(overlay_widget.painter.strokes)} item(s) at offset {offset}")
     
-    return abs_path
\ No newline at end of file
+    # Hand the PNG encode to the background encoder; the GUI moves on now
+    if path is not None:
+        return save_capture_async(screenshot, path)
+    return store_capture(screenshot)
\ No newline at end of file
@@ -0,0 +1,187 @@
+import os
+import re
+import time
+import secrets
+import hashlib
+import logging
+
+CAPTURE_ROOT = "captures"
+# Content-addressed copies, hard-linked to every capture with the same pixels
+OBJECTS_DIR = "objects"
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+DEFAULT_MAX_AGE_DAYS = 30
+# Never evict files this young: their message row may not be written yet
+GRACE_SECONDS = 3600
+
+# Only the store's own names: <2 hex>/<40 hex>.png. Anything else under
+# captures/ (the old flat q_HHMMSS.png grabs and exports) is left alone.
+_SHARD = re.compile(r"[0-9a-f]{2}")
+_NAME = re.compile(r"[0-9a-f]{40}\.png")
+
+
+def write_png(image, path):
+    # Write to a temp name first: an existing path means a complete file (dedup relies on it)
+    tmp_path = path + ".tmp"
+    image.save(tmp_path, format="PNG")
+    os.replace(tmp_path, path)
+    logging.info(f"Screenshot saved successfully to: {path} ({os.path.getsize(path)} bytes)")
+
+
+class CaptureStore:
+    """
+    Sharded capture directory with content dedup.
+    Each capture gets a fresh name up front, so the GUI never waits on the
+    pixels. The encoder thread hashes them and hard-links identical grabs to
+    one copy under objects/, keyed by that hash. Retention only ever removes
+    files no chat message references.
+    """
+    def __init__(self, root=CAPTURE_ROOT, max_bytes=DEFAULT_MAX_BYTES, max_age_days=DEFAULT_MAX_AGE_DAYS):
+        self.root = os.path.abspath(root)
+        self.objects = os.path.join(self.root, OBJECTS_DIR)
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+
+    @staticmethod
+    def digest(image):
+        """Hash of the raw pixels (plus mode and size), independent of PNG settings."""
+        h = hashlib.blake2b(digest_size=20)
+        h.update(f"{image.mode}:{image.size[0]}x{image.size[1]}:".encode())
+        h.update(image.tobytes())
+        return h.hexdigest()
+
+    @staticmethod
+    def _sharded(root, name):
+        shard = os.path.join(root, name[:2])
+        os.makedirs(shard, exist_ok=True)
+        return os.path.join(shard, f"{name}.png")
+
+    def new_path(self):
+        """A fresh capture path; cheap enough for the GUI thread."""
+        return self._sharded(self.root, secrets.token_hex(20))
+
+    def put(self, image, path):
+        """
+        Writes `image` to `path`; runs on the encoder thread. An identical
+        earlier grab is hard-linked instead of encoded again.
+        """
+        digest = self.digest(image)
+        obj = self._sharded(self.objects, digest)
+        if os.path.exists(obj):
+            try:
+                os.link(obj, path)
+                logging.info(f"Capture deduplicated: {path}")
+                return
+            except OSError as e:
+                logging.debug(f"Hard link failed, encoding again: {e}")
+        write_png(image, path)
+        try:
+            os.link(path, obj)
+        except FileExistsError:
+            pass
+        except OSError as e:
+            # No hard links on this filesystem: captures still work, just without dedup
+            logging.debug(f"Could not register {path} for dedup: {e}")
+
+    def _scan(self, root):
+        """Yields (path, stat) for every <2 hex>/<40 hex>.png file below root."""
+        if not os.path.isdir(root):
+            return
+        for shard in os.listdir(root):
+            shard_dir = os.path.join(root, shard)
+            if not _SHARD.fullmatch(shard) or not os.path.isdir(shard_dir):
+                continue
+            for name in os.listdir(shard_dir):
+                if not (_NAME.fullmatch(name) and name.startswith(shard)):
+                    continue
+                path = os.path.join(shard_dir, name)
+                try:
+                    yield path, os.stat(path)
+                except OSError:
+                    continue
+
+    def _files(self):
+        """Yields (path, size, mtime) for every stored capture."""
+        for path, st in self._scan(self.root):
+            yield path, st.st_size, st.st_mtime
+
+    def _disk_usage(self):
+        """Bytes on disk, counting hard-linked copies once."""
+        seen = {}
+        for root in (self.root, self.objects):
+            for _, st in self._scan(root):
+                seen[(st.st_dev, st.st_ino)] = st.st_size
+        return sum(seen.values())
+
+    def stats(self):
+        files = list(self._files())
+        oldest = min((mtime for _, _, mtime in files), default=None)
+        return {
+            "files": len(files),
+            "bytes": self._disk_usage(),
+            "max_bytes": self.max_bytes,
+            "oldest": oldest,
+        }
+
+    def enforce_retention(self, referenced_paths):
+        """
+        Deletes unreferenced captures older than max_age_days, then the oldest
+        unreferenced ones until the store fits in max_bytes. A dedup copy goes
+        with the last capture linked to it.
+        Returns (files_removed, bytes_freed).
+        """
+        referenced = {os.path.normcase(os.path.abspath(p)) for p in referenced_paths if p}
+        now = time.time()
+        max_age = self.max_age_days * 86400
+
+        objects = {(st.st_dev, st.st_ino): path for path, st in self._scan(self.objects)}
+        files = list(self._scan(self.root))
+        links = {(st.st_dev, st.st_ino): st.st_nlink for _, st in files}
+        total = self._disk_usage()
+        candidates = sorted(
+            (st.st_mtime, path, st) for path, st in files
+            if os.path.normcase(path) not in referenced and now - st.st_mtime > GRACE_SECONDS
+        )
+
+        removed, freed = 0, 0
+        for mtime, path, st in candidates:
+            if now - mtime <= max_age and total <= self.max_bytes:
+                break
+            key = (st.st_dev, st.st_ino)
+            try:
+                os.remove(path)
+            except OSError as e:
+                logging.warning(f"Could not evict capture {path}: {e}")
+                continue
+            removed += 1
+            links[key] -= 1
+            if links[key] == 1 and key in objects:
+                # Only the dedup copy is left
+                try:
+                    os.remove(objects.pop(key))
+                    links[key] = 0
+                except OSError:
+                    pass
+            if links[key] == 0:
+                freed += st.st_size
+                total -= st.st_size
+
+        # Dedup copies whose captures are all gone
+        for path, st in self._scan(self.objects):
+            if st.st_nlink == 1:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+        # Drop shard directories the eviction emptied
+        for root in (self.root, self.objects):
+            for shard in os.listdir(root) if os.path.isdir(root) else ():
+                if _SHARD.fullmatch(shard):
+                    try:
+                        os.rmdir(os.path.join(root, shard))
+                    except OSError:
+                        pass  # not empty
+
+        if removed:
+            logging.info(f"Capture retention: removed {removed} file(s), freed {freed} bytes")
+        return removed, freed
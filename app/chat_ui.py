@@ -4,88 +4,24 @@ from datetime import datetime
 from PyQt6.QtWidgets import (
     QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
     QTextEdit, QLineEdit, QPushButton, QLabel, 
-    QScrollArea, QFrame, QSizePolicy, QFileDialog,
-    QComboBox, QMessageBox, QTextBrowser
+    QScrollArea, QFrame, QFileDialog,
+    QComboBox, QMessageBox
 )
 from PyQt6.QtCore import Qt, pyqtSignal, QSize, QTimer, QPropertyAnimation, QRect
 from PyQt6.QtGui import (
     QFont, QPainter, QColor, QPainterPath, 
-    QLinearGradient, QPixmap, QIcon
+    QLinearGradient, QIcon
 )
 
-from .database import DatabaseManager
+from .database import DatabaseManager, DEFAULT_TITLE, session_title
 from .worker import AIWorker
+from .summarizer import SessionSummarizer, summary_messages
+from .transcript import TranscriptView
 
-
-# ==================== MODERN CHAT BUBBLE ====================
-class ChatBubble(QFrame):
-    def __init__(self, role, text, image_path=None, parent=None):
-        super().__init__(parent)
-        self.role = role  # 'user' or 'model'
-        self.text_content = text
-        self.image_path = image_path
-        
-        layout = QVBoxLayout(self)
-        layout.setContentsMargins(12, 10, 12, 10)
-        layout.setSpacing(6)
-        
-        # If there's an image, show it
-        if image_path and os.path.exists(image_path):
-            img_label = QLabel()
-            pixmap = QPixmap(image_path)
-            # Scale to max 400px width while maintaining aspect ratio
-            scaled = pixmap.scaledToWidth(400, Qt.TransformationMode.SmoothTransformation)
-            img_label.setPixmap(scaled)
-            img_label.setMaximumWidth(400)
-            layout.addWidget(img_label)
-        
-        # Message text - Use QTextBrowser for proper resizing
-        text_label = QTextBrowser()
-        text_label.setPlainText(text)
-        text_label.setReadOnly(True)
-        text_label.setFont(QFont("Segoe UI", 11))
-        text_label.setFrameStyle(QFrame.Shape.NoFrame)
-        text_label.setVerticalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
-        text_label.setHorizontalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
-        text_label.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Minimum)
-        
-        # Auto-adjust height based on content
-        text_label.document().documentLayout().documentSizeChanged.connect(
-            lambda: text_label.setFixedHeight(int(text_label.document().size().height()) + 4)
-        )
-        
-        if role == 'user':
-            text_label.setStyleSheet("background: transparent; color: rgba(255,255,255,240); border: none;")
-        else:
-            text_label.setStyleSheet("background: transparent; color: rgba(240,240,255,255); border: none;")
-        
-        layout.addWidget(text_label)
-        self.text_widget = text_label  # Store reference for updates
-        
-        # Style based on role
-        if role == 'user':
-            self.setObjectName("UserBubble")
-            self.setStyleSheet("""
-                QFrame#UserBubble {
-                    background: qlineargradient(x1:0, y1:0, x2:1, y2:1,
-                        stop:0 rgba(90, 90, 95, 200), 
-                        stop:1 rgba(110, 110, 115, 200));
-                    border-radius: 18px;
-                    border: 1px solid rgba(180,180,185,50);
-                }
-            """)
-        else:
-            self.setObjectName("ModelBubble")
-            self.setStyleSheet("""
-                QFrame#ModelBubble {
-                    background: rgba(55, 55, 60, 180);
-                    border-radius: 18px;
-                    border: 1px solid rgba(150,150,155,40);
-                }
-            """)
-        
-        # Limit width for elegant layout
-        self.setSizePolicy(QSizePolicy.Policy.Preferred, QSizePolicy.Policy.Minimum)
+# Streamed text is flushed to the bubble at most once per display frame
+FRAME_MS = 16
+# Messages fetched per page when opening a session or scrolling back
+PAGE_SIZE = 50
 
 
 # ==================== SIDEBAR CHAT ITEM ====================
@@ -286,6 +222,10 @@ class Sidebar(QFrame):
         self.session_layout.insertWidget(0, item)
         self.session_widgets[session_id] = item
     
+    def rename_session(self, session_id, title):
+        if session_id in self.session_widgets:
+            self.session_widgets[session_id].title_label.setText(title)
+
     def set_active_session(self, session_id):
         # Deactivate all
         for sid, widget in self.session_widgets.items():
@@ -316,10 +256,24 @@ class ChatWindow(QMainWindow):
         super().__init__()
         self.ai_client = ai_client
         self.db = DatabaseManager()
+        self.summarizer = None
         
         self.current_session_id = None
         self.current_worker = None
+        self.current_response_key = None
         self.current_response_text = ""
+        self.pending_chunks = []
+        self.oldest_loaded_id = None
+        self.history_exhausted = True
+
+        # --- Streaming render: one flush and one scroll per frame at most ---
+        self.flush_timer = QTimer(self)
+        self.flush_timer.setSingleShot(True)
+        self.flush_timer.setInterval(FRAME_MS)
+        self.flush_timer.timeout.connect(self.flush_stream)
+        self.scroll_timer = QTimer(self)
+        self.scroll_timer.setSingleShot(True)
+        self.scroll_timer.timeout.connect(self._scroll_now)
         
         self.setWindowTitle("Canvas AI Chat")
         self.setMinimumSize(1200, 800)
@@ -353,14 +307,15 @@ class ChatWindow(QMainWindow):
         chat_layout.setContentsMargins(0, 0, 0, 0)
         chat_layout.setSpacing(0)
         
-        # Chat Display Area
-        self.chat_scroll = QScrollArea()
-        self.chat_scroll.setWidgetResizable(True)
-        self.chat_scroll.setHorizontalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
-        self.chat_scroll.setStyleSheet("""
-            QScrollArea {
+        # Chat Display Area (virtualized: only visible messages are laid out)
+        self.transcript_view = TranscriptView()
+        self.transcript = self.transcript_view.transcript
+        self.transcript_view.near_top.connect(self.load_older_messages)
+        self.transcript_view.setStyleSheet("""
+            QListView {
                 background: transparent;
                 border: none;
+                padding: 8px 0px;
             }
             QScrollBar:vertical {
                 background: rgba(55,55,60,100);
@@ -373,15 +328,7 @@ class ChatWindow(QMainWindow):
                 min-height: 30px;
             }
         """)
-        
-        self.chat_container = QWidget()
-        self.chat_layout = QVBoxLayout(self.chat_container)
-        self.chat_layout.setContentsMargins(16, 8, 16, 8)
-        self.chat_layout.setSpacing(12)
-        self.chat_layout.addStretch()
-        
-        self.chat_scroll.setWidget(self.chat_container)
-        chat_layout.addWidget(self.chat_scroll, 1)
+        chat_layout.addWidget(self.transcript_view, 1)
         
         # Input Area
         input_container = QFrame()
@@ -527,10 +474,17 @@ class ChatWindow(QMainWindow):
         sessions = self.db.get_sessions()
         self.sidebar.load_sessions(sessions)
     
+    def update_session_title(self, content):
+        """Mirrors the title add_message() commits, without waiting on the write."""
+        item = self.sidebar.session_widgets.get(self.current_session_id)
+        if item is not None and item.title_label.text() == DEFAULT_TITLE:
+            self.sidebar.rename_session(self.current_session_id, session_title(content))
+        self.sidebar.set_active_session(self.current_session_id)
+
     def create_new_chat(self):
         """Create a new chat session"""
         session_id = self.db.create_session()
-        self.sidebar.add_session(session_id, "New Chat")
+        self.sidebar.add_session(session_id, DEFAULT_TITLE)
         self.load_session(session_id)
     
     def load_session(self, session_id):
@@ -541,13 +495,25 @@ class ChatWindow(QMainWindow):
         # Clear current chat display
         self.clear_chat_display()
         
-        # Load messages from database
-        messages = self.db.get_messages(session_id)
-        for msg in messages:
-            self.add_chat_bubble(msg['role'], msg['text'], msg['image_path'])
+        # Only the newest page is loaded; older ones follow as the user scrolls up
+        page = self.db.get_messages(session_id, limit=PAGE_SIZE)
+        self.oldest_loaded_id = page[0]['id'] if page else None
+        self.history_exhausted = len(page) < PAGE_SIZE
+        self.transcript.set_messages(page)
         
         self.scroll_to_bottom()
     
+    def load_older_messages(self):
+        """Fetches pages before the oldest loaded message until the view can scroll"""
+        while not self.history_exhausted and self.oldest_loaded_id is not None:
+            page = self.db.get_messages(self.current_session_id, before_id=self.oldest_loaded_id, limit=PAGE_SIZE)
+            self.history_exhausted = len(page) < PAGE_SIZE
+            if page:
+                self.oldest_loaded_id = page[0]['id']
+                self.transcript_view.prepend_page(page)
+            if self.transcript_view.is_scrollable():
+                break
+    
     def delete_session(self, session_id):
         """Delete a chat session"""
         self.db.delete_session(session_id)
@@ -559,42 +525,25 @@ class ChatWindow(QMainWindow):
     
     def clear_chat_display(self):
         """Clear all chat bubbles"""
-        for i in reversed(range(self.chat_layout.count())):
-            widget = self.chat_layout.itemAt(i).widget()
-            if widget and not isinstance(widget, type(None)):
-                # Skip the stretch item at the end
-                if widget.objectName() != "stretch":
-                    widget.deleteLater()
-    
-    def add_chat_bubble(self, role, text, image_path=None):
-        """Add a chat bubble to the display"""
-        bubble = ChatBubble(role, text, image_path)
-        
-        # Create a container for alignment control
-        container = QWidget()
-        container_layout = QHBoxLayout(container)
-        container_layout.setContentsMargins(0, 0, 0, 0)
-        container_layout.setSpacing(0)
-        
-        if role == 'user':
-            # User on right - 30% space, 70% bubble
-            container_layout.addStretch(3)
-            container_layout.addWidget(bubble, 7)
-        else:
-            # AI on left - 70% bubble, 30% space
-            container_layout.addWidget(bubble, 7)
-            container_layout.addStretch(3)
-        
-        # Insert before the stretch
-        self.chat_layout.insertWidget(self.chat_layout.count() - 1, container)
-        
+        self.current_response_key = None
+        self.transcript.clear()
+    
+    def add_chat_bubble(self, role, text, image_path=None, preview=None):
+        """Add a chat bubble to the display, returns its row key"""
+        key = self.transcript.append_message(role, text, image_path, preview)
         self.scroll_to_bottom()
+        return key
+    
+    def scroll_to_bottom(self, delay=100):
+        """Scroll chat to bottom once layout settles; repeated calls share one pending scroll"""
+        if not self.scroll_timer.isActive():
+            self.scroll_timer.start(delay)
     
-    def scroll_to_bottom(self):
-        """Scroll chat to bottom"""
-        QTimer.singleShot(100, lambda: self.chat_scroll.verticalScrollBar().setValue(
-            self.chat_scroll.verticalScrollBar().maximum()
-        ))
+    def _scroll_now(self):
+        self.transcript_view.scrollToBottom()
+        # A short first page leaves nothing to scroll up through; fetch more right away
+        if not self.transcript_view.is_scrollable():
+            self.load_older_messages()
     
     def attach_files(self):
         """Attach files for context"""
@@ -630,9 +579,8 @@ class ChatWindow(QMainWindow):
         # Save to database
         self.db.add_message(self.current_session_id, 'user', user_input, file_paths=self.attached_files)
         
-        # Reload sidebar to update session title
-        self.load_sidebar()
-        self.sidebar.set_active_session(self.current_session_id)
+        # Update the session title in place; reloading would wait on the commit
+        self.update_session_title(user_input)
         
         # Prepare conversation history
         history = self.build_conversation_history()
@@ -642,10 +590,8 @@ class ChatWindow(QMainWindow):
         self.input_field.setEnabled(False)
         
         # Create AI response bubble (initially empty)
-        self.current_response_text = ""
-        self.current_response_bubble = ChatBubble('model', "")
-        self.chat_layout.insertWidget(self.chat_layout.count() - 1, self.current_response_bubble)
-        self.chat_layout.setAlignment(self.current_response_bubble, Qt.AlignmentFlag.AlignLeft)
+        self.reset_stream()
+        self.current_response_key = self.add_chat_bubble('model', "")
         
         # Start AI worker
         # --- FIX: Pass a COPY of the list, not the reference ---
@@ -661,12 +607,18 @@ class ChatWindow(QMainWindow):
         self.update_file_badge()
     
     def build_conversation_history(self):
-        """Build conversation history for AI"""
-        messages = self.db.get_messages(self.current_session_id)
-        history = []
+        """Build conversation history for AI: rolling summary plus the turns after it"""
+        # In-memory after the first send; add_message keeps it current
+        messages = self.db.get_session_history(self.current_session_id)
+        summary, through_id = self.db.get_summary(self.current_session_id)
+        history = summary_messages(summary) if summary else []
         
         for msg in messages:
+            # Rows still queued for the writer have no id yet and are always recent
+            if msg['id'] is not None and msg['id'] <= through_id:
+                continue
             history.append({
+                'id': msg['id'],
                 'role': msg['role'],
                 'text': msg['text'],
                 'images': [msg['image_path']] if msg['image_path'] else []
@@ -674,26 +626,39 @@ class ChatWindow(QMainWindow):
         
         return history
     
+    def reset_stream(self):
+        self.current_response_text = ""
+        self.pending_chunks = []
+        self.flush_timer.stop()
+    
     def on_chunk_received(self, chunk):
-        """Handle streaming AI response chunks"""
-        self.current_response_text += chunk
-        
-        # Update the bubble's text using the stored text_widget reference
-        if (hasattr(self, 'current_response_bubble') and 
-            self.current_response_bubble and 
-            hasattr(self.current_response_bubble, 'text_widget')):
-            try:
-                self.current_response_bubble.text_widget.setPlainText(self.current_response_text)
-            except RuntimeError:
-                # Widget was deleted, ignore
-                pass
+        """Handle streaming AI response chunks: buffered until the next frame"""
+        self.pending_chunks.append(chunk)
+        if not self.flush_timer.isActive():
+            self.flush_timer.start()
+    
+    def flush_stream(self):
+        """Appends everything received since the last frame to the response bubble"""
+        if not self.pending_chunks:
+            return
+        text = "".join(self.pending_chunks)
+        self.pending_chunks = []
+        self.current_response_text += text
         
-        self.scroll_to_bottom()
+        # The session may have been switched mid-stream; the text still gets saved
+        if self.current_response_key is not None:
+            self.transcript.append_text(self.current_response_key, text)
+        
+        self.scroll_to_bottom(FRAME_MS)
     
     def on_ai_finished(self):
         """Handle AI response completion"""
+        self.flush_timer.stop()
+        self.flush_stream()
+        
         # Save to database
         self.db.add_message(self.current_session_id, 'model', self.current_response_text)
+        self.schedule_summary()
         
         # Re-enable input
         self.send_btn.setEnabled(True)
@@ -702,16 +667,24 @@ class ChatWindow(QMainWindow):
         
         # Cleanup
         self.current_worker = None
-        self.current_response_bubble = None
-        if hasattr(self, 'current_response_container'):
-            self.current_response_container = None
+        self.current_response_key = None
+    
+    def schedule_summary(self):
+        """Folds aged-out turns into the session summary in the background"""
+        if self.summarizer and self.summarizer.isRunning():
+            # It will catch up after the next turn
+            return
+        self.summarizer = SessionSummarizer(self.ai_client, self.db, self.current_session_id)
+        self.summarizer.start()
     
     def on_ai_error(self, error_msg):
         """Handle AI errors"""
+        self.reset_stream()
+        
         # Remove the empty bubble
-        if self.current_response_bubble:
-            self.current_response_bubble.deleteLater()
-            self.current_response_bubble = None
+        if self.current_response_key is not None:
+            self.transcript.remove(self.current_response_key)
+            self.current_response_key = None
         
         # Show error bubble
         self.add_chat_bubble('model', f"❌ Error: {error_msg}")
@@ -720,8 +693,11 @@ class ChatWindow(QMainWindow):
         self.send_btn.setEnabled(True)
         self.input_field.setEnabled(True)
     
-    def handle_capture(self, image_path, prompt, attached_files, model):
+    def handle_capture(self, capture, prompt, attached_files, model):
         """Handle screen capture from Canvas overlay"""
+        # The PNG is written in the background; only the path is needed here
+        image_path = capture.path if capture else None
+
         # Ensure we have an active session
         if not self.current_session_id:
             self.create_new_chat()
@@ -761,19 +737,15 @@ class ChatWindow(QMainWindow):
             if not os.path.isabs(image_path):
                 image_path = os.path.abspath(image_path)
             
-            if not os.path.exists(image_path):
-                logging.error(f"Captured image not found: {image_path}")
-                return
-            
             # Save user message with image
             self.db.add_message(self.current_session_id, 'user', prompt or "Analyze this image", image_path)
             
-            # Display user bubble with image
-            self.add_chat_bubble('user', prompt or "Analyze this image", image_path)
+            # Display user bubble with image, previewed from memory while it saves
+            self.add_chat_bubble('user', prompt or "Analyze this image", image_path,
+                                 preview=None if capture.done() else capture.preview())
             
-            # Reload sidebar
-            self.load_sidebar()
-            self.sidebar.set_active_session(self.current_session_id)
+            # Update the session title in place
+            self.update_session_title(prompt or "Analyze this image")
             
             # FORCE Gemini provider for image analysis
             self.ai_client.set_model("gemini-2.5-flash")
@@ -785,20 +757,8 @@ class ChatWindow(QMainWindow):
             self.input_field.setEnabled(False)
             
             # Create AI response bubble
-            self.current_response_text = ""
-            self.current_response_bubble = ChatBubble('model', "")
-            
-            # Use container for proper alignment
-            response_container = QWidget()
-            container_layout = QHBoxLayout(response_container)
-            container_layout.setContentsMargins(0, 0, 0, 0)
-            container_layout.setSpacing(0)
-            
-            container_layout.addWidget(self.current_response_bubble, 7)
-            container_layout.addStretch(3)
-            
-            self.chat_layout.insertWidget(self.chat_layout.count() - 1, response_container)
-            self.current_response_container = response_container
+            self.reset_stream()
+            self.current_response_key = self.add_chat_bubble('model', "")
             
             # Start AI worker
             # --- FIX: Pass a COPY of the list ---
@@ -0,0 +1,139 @@
+import math
+import logging
+import threading
+from collections import OrderedDict
+from PIL import Image
+
+from .image_prep import get_budget, lookup_model_budget, tile_layout, WIDE_ASPECT, MAX_TILES
+
+# Context window per provider, in tokens, looked up with lookup_model_budget().
+# Ollama is asked for exactly this window (num_ctx), so the budget is real.
+CONTEXT_BUDGETS = {
+    # Kept well under the window so free tier tokens-per-minute limits hold
+    "gemini": {"default": 100_000},
+    "ollama": {"default": 8192, "llama3.1": 16384, "llama3.2": 16384, "qwen": 16384, "llava": 4096},
+}
+DEFAULT_CONTEXT_BUDGET = 8192
+
+RESPONSE_RESERVE = 0.15   # share of the window left free for the answer
+FILE_SHARE = 0.5          # attached files may use at most this share of what's left
+CHARS_PER_TOKEN = 4
+MESSAGE_OVERHEAD = 4      # role markers and separators per message
+
+# Gemini bills 258 tokens per 768px tile; vision encoders in Ollama use a fixed patch grid
+GEMINI_TILE = 768
+GEMINI_TILE_TOKENS = 258
+OLLAMA_IMAGE_TOKENS = 576
+
+COUNT_CACHE_SIZE = 4096
+
+
+def estimate_tokens(text):
+    """
+    Fast heuristic: ~4 ASCII characters per token, one token per other
+    character (CJK, emoji and accented text tokenize much more densely).
+    """
+    if not text:
+        return 0
+    ascii_chars = len(text.encode("ascii", errors="ignore"))
+    return math.ceil(ascii_chars / CHARS_PER_TOKEN) + (len(text) - ascii_chars)
+
+
+class TokenCounter:
+    """Memoizes token estimates for messages and images across turns."""
+    def __init__(self, max_entries=COUNT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.counts = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _cached(self, key, compute):
+        with self.lock:
+            if key in self.counts:
+                self.counts.move_to_end(key)
+                return self.counts[key]
+        count = compute()
+        with self.lock:
+            self.counts[key] = count
+            while len(self.counts) > self.max_entries:
+                self.counts.popitem(last=False)
+        return count
+
+    def image_tokens(self, path, provider, model):
+        budget = get_budget(provider, model)
+        return self._cached(("image", path, provider, budget),
+                            lambda: _image_tokens(path, provider, budget))
+
+    def message_tokens(self, msg, provider, model):
+        # Stored messages are immutable, so their id is a stable key
+        text_key = msg.get('id') or msg['text']
+        text = self._cached(("text", text_key), lambda: estimate_tokens(msg['text']))
+        images = sum(self.image_tokens(path, provider, model) for path in msg.get('images', []))
+        return text + images + MESSAGE_OVERHEAD
+
+
+def _image_tokens(path, provider, budget):
+    max_megapixels, max_edge = budget
+    try:
+        # Only reads the header
+        with Image.open(path) as img:
+            w, h = img.size
+    except Exception:
+        w, h = max_edge, max_edge * 9 // 16
+
+    parts = 1
+    if w / h > WIDE_ASPECT:
+        # Same split as image_prep._select_tiles, which sends at most MAX_TILES of the tiles
+        count, w = tile_layout(w, h)
+        parts = min(MAX_TILES, count)
+    scale = min(1.0, max_edge / max(w, h), math.sqrt(max_megapixels * 1_000_000 / (w * h)))
+    w, h = w * scale, h * scale
+
+    if provider == "gemini":
+        per_part = math.ceil(w / GEMINI_TILE) * math.ceil(h / GEMINI_TILE) * GEMINI_TILE_TOKENS
+    else:
+        per_part = OLLAMA_IMAGE_TOKENS
+    return parts * per_part
+
+
+token_counter = TokenCounter()
+
+
+def context_window(provider, model):
+    """Full context window in tokens, prompt and response together."""
+    return lookup_model_budget(CONTEXT_BUDGETS, provider, model, DEFAULT_CONTEXT_BUDGET)
+
+
+def context_budget(provider, model):
+    """Tokens available for the prompt after reserving room for the response."""
+    return int(context_window(provider, model) * (1 - RESPONSE_RESERVE))
+
+
+def file_char_budget(provider, model):
+    """Characters of attached file text one request may carry."""
+    return int(context_budget(provider, model) * FILE_SHARE) * CHARS_PER_TOKEN
+
+
+def pack_history(history, provider, model, reserved=0):
+    """
+    Newest-first packing: keeps the most recent messages that fit in the
+    model's budget minus `reserved` tokens (file context etc.). The latest
+    message and pinned ones (the session summary) are always kept.
+    Returns (messages, tokens_used).
+    """
+    budget = context_budget(provider, model) - reserved
+    pinned = [msg for msg in history if msg.get('pinned')]
+    used = sum(token_counter.message_tokens(msg, provider, model) for msg in pinned)
+    packed = []
+    for msg in reversed(history):
+        if msg.get('pinned'):
+            continue
+        tokens = token_counter.message_tokens(msg, provider, model)
+        if packed and used + tokens > budget:
+            break
+        packed.append(msg)
+        used += tokens
+    packed = pinned + packed[::-1]
+
+    logging.info(f"Packed {len(packed)}/{len(history)} messages for {provider}/{model}: "
+                 f"{used} + {reserved} reserved of {budget + reserved} tokens")
+    return packed, used
@@ -0,0 +1,125 @@
+import sys
+import logging
+import keyboard # pip install keyboard
+from PyQt6.QtWidgets import QSystemTrayIcon, QMenu, QStyle
+from PyQt6.QtGui import QAction
+from PyQt6.QtCore import QObject, pyqtSignal
+
+from .ui import GhostUI
+from .chat_ui import ChatWindow
+from .ai_client import AIClient
+from .capture import schedule_retention
+
+class AppController(QObject):
+    open_canvas_signal = pyqtSignal() # Thread-safe signal
+
+    def __init__(self, app):
+        super().__init__()
+        self.app = app
+        
+        try:
+            logging.info("Initializing Backend...")
+            
+            # 1. Dependency Injection
+            self.ai_client = AIClient()
+            
+            # 2. Init Windows
+            self.chat_win = ChatWindow(self.ai_client)
+            self.ghost_win = GhostUI(self.ai_client)
+            
+            # 3. Wiring Signals
+            # When Canvas captures -> Send to Chat
+            self.ghost_win.capture_completed.connect(self.handle_canvas_capture)
+            
+            # When Hotkey pressed -> Toggle Canvas
+            self.open_canvas_signal.connect(self.toggle_canvas)
+
+            # 4. System Tray
+            self.setup_tray()
+
+            # Evict old captures no message refers to anymore (off the GUI thread)
+            schedule_retention(self.chat_win.db.get_image_paths())
+
+            # 5. Register Hotkey (Alt+Q)
+            # We use a lambda to emit a Qt signal because 'keyboard' runs in a background thread
+            try:
+                keyboard.add_hotkey('alt+q', lambda: self.open_canvas_signal.emit())
+                logging.info("Global Hotkey 'Alt+Q' registered.")
+            except ImportError:
+                logging.warning("Library 'keyboard' not installed. Hotkeys disabled.")
+            except Exception as e:
+                logging.error(f"Hotkey Error: {e}")
+
+            # 6. App starts minimally - windows only open when triggered
+            # (Chat opens via tray click, Canvas via Alt+Q)
+
+            logging.info("-------------------------------------------")
+            logging.info("AI Shell Running")
+            logging.info("-> Click Tray Icon to open Chat")
+            logging.info("-> Press Alt+Q to open Canvas")
+            logging.info("-------------------------------------------")
+
+        except Exception as e:
+            logging.critical(f"Startup Error: {e}", exc_info=True)
+            sys.exit(1)
+
+    def setup_tray(self):
+        self.tray_icon = QSystemTrayIcon(self.app)
+        
+        # --- FIX: Use SP_ComputerIcon instead of the non-existent ShellIcon ---
+        icon = self.app.style().standardIcon(QStyle.StandardPixmap.SP_ComputerIcon)
+        self.tray_icon.setIcon(icon)
+        self.tray_icon.setToolTip("AI Shell")
+
+        # Context Menu
+        menu = QMenu()
+        
+        action_chat = QAction("Open AI Chat", self.app)
+        action_chat.triggered.connect(self.toggle_chat)
+        menu.addAction(action_chat)
+
+        action_canvas = QAction("Open Canvas Overlay (Alt+Q)", self.app)
+        action_canvas.triggered.connect(self.toggle_canvas)
+        menu.addAction(action_canvas)
+
+        menu.addSeparator()
+
+        action_exit = QAction("Exit", self.app)
+        action_exit.triggered.connect(self.exit_app)
+        menu.addAction(action_exit)
+
+        self.tray_icon.setContextMenu(menu)
+        
+        # Click tray to toggle chat
+        self.tray_icon.activated.connect(lambda reason: self.toggle_chat() if reason in (
+            QSystemTrayIcon.ActivationReason.Trigger, 
+            QSystemTrayIcon.ActivationReason.DoubleClick
+        ) else None)
+        
+        self.tray_icon.show()
+
+    def toggle_chat(self):
+        # Logic: If hidden, show Maximized. 
+        if self.chat_win.isVisible():
+            self.chat_win.hide()
+        else:
+            self.chat_win.showMaximized() # <--- CHANGED FROM show()
+            self.chat_win.raise_()
+            self.chat_win.activateWindow()
+
+    def toggle_canvas(self):
+        if self.ghost_win.isVisible():
+            self.ghost_win.hide()
+        else:
+            # Reset before showing, and grab the clean screen before the overlay covers it
+            self.ghost_win.clear_all()
+            self.ghost_win.show_with_frame()
+            self.ghost_win.raise_()
+            self.ghost_win.activateWindow()
+
+    def handle_canvas_capture(self, capture, prompt, attached_files, model):
+        # Open chat and pass the screenshot data (the file may still be encoding)
+        self.chat_win.handle_capture(capture, prompt, attached_files, model)
+
+    def exit_app(self):
+        self.app.quit()
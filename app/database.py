@@ -1,14 +1,197 @@
 import sqlite3
 import json
 import os
+import queue
+import atexit
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, wait
 from datetime import datetime
 
 DB_FILE = "chat_history.db"
+DEFAULT_TITLE = "New Chat"
+# Sessions whose full history is kept in memory
+HISTORY_CACHE_SESSIONS = 8
+# Most queued writes folded into one transaction
+WRITE_BATCH_SIZE = 64
+
+# WAL lets the GUI read while the writer commits; NORMAL skips the fsync on every commit
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000",
+)
+
+def connect(db_file=DB_FILE, **kwargs):
+    conn = sqlite3.connect(db_file, check_same_thread=False, **kwargs)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+def session_title(content):
+    """Sidebar title derived from a session's first user message."""
+    return (content[:30] + '..') if len(content) > 30 else content
+
+
+class DatabaseWriter(threading.Thread):
+    """
+    Owns the only writing connection. Writes are queued as callables taking
+    a cursor; everything waiting in the queue is committed together in one
+    transaction (each write in its own savepoint, so one failure doesn't
+    sink the batch). submit() returns a Future with the callable's result.
+    """
+    def __init__(self, db_file=DB_FILE, batch_size=WRITE_BATCH_SIZE):
+        super().__init__(name="db-writer", daemon=True)
+        self.batch_size = batch_size
+        # Autocommit mode: transactions are opened explicitly per batch
+        self.conn = connect(db_file, isolation_level=None)
+        self.queue = queue.Queue()
+        # Keeps last_future in queue order when several threads submit
+        self.submit_lock = threading.Lock()
+        self.last_future = None
+        self.closed = False
+
+    def submit(self, write):
+        future = Future()
+        with self.submit_lock:
+            self.last_future = future
+            self.queue.put((write, future))
+        return future
+
+    def flush(self):
+        """Waits until every write submitted so far is committed."""
+        future = self.last_future
+        if future is not None and not future.done():
+            wait([future])
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.queue.put(None)
+            self.join()
+
+    def run(self):
+        stop = False
+        while not stop:
+            item = self.queue.get()
+            if item is None:
+                break
+            batch = [item]
+            while len(batch) < self.batch_size:
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            self._commit(batch)
+        self.conn.close()
+
+    def _commit(self, batch):
+        cursor = self.conn.cursor()
+        results = []
+        try:
+            cursor.execute("BEGIN")
+            for write, future in batch:
+                cursor.execute("SAVEPOINT write")
+                try:
+                    results.append((future, write(cursor), None))
+                    cursor.execute("RELEASE write")
+                except Exception as e:
+                    cursor.execute("ROLLBACK TO write")
+                    cursor.execute("RELEASE write")
+                    results.append((future, None, e))
+            cursor.execute("COMMIT")
+        except Exception as e:
+            logging.error(f"DB writer: batch of {len(batch)} failed: {e}")
+            if self.conn.in_transaction:
+                self.conn.rollback()
+            results = [(future, None, e) for _, future in batch]
+
+        for future, result, error in results:
+            if error is not None:
+                logging.error(f"DB writer: write failed: {error}")
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+class SessionHistoryCache:
+    """
+    In-memory copy of recently used sessions' messages and summaries.
+    DatabaseManager keeps it in step with every write, so building a
+    request never has to read SQLite again.
+    """
+    def __init__(self, max_sessions=HISTORY_CACHE_SESSIONS):
+        self.max_sessions = max_sessions
+        self.messages = OrderedDict()  # {session_id: [message dict, ...]}
+        self.summaries = {}            # {session_id: (summary, through_id)}
+        self.versions = {}             # {session_id: appends so far}
+        self.lock = threading.Lock()
+
+    def get(self, session_id):
+        with self.lock:
+            messages = self.messages.get(session_id)
+            if messages is None:
+                return None
+            self.messages.move_to_end(session_id)
+            return list(messages)
+
+    def version(self, session_id):
+        with self.lock:
+            return self.versions.get(session_id, 0)
+
+    def put(self, session_id, messages, version):
+        with self.lock:
+            # A message written while this was being loaded might be missing from it
+            if self.versions.get(session_id, 0) != version:
+                return
+            self.messages[session_id] = list(messages)
+            self.messages.move_to_end(session_id)
+            while len(self.messages) > self.max_sessions:
+                evicted, _ = self.messages.popitem(last=False)
+                self.summaries.pop(evicted, None)
+
+    def append(self, session_id, message):
+        # Sessions that aren't cached are loaded in full on next use
+        with self.lock:
+            self.versions[session_id] = self.versions.get(session_id, 0) + 1
+            messages = self.messages.get(session_id)
+            if messages is not None:
+                messages.append(message)
+
+    def invalidate(self, session_id):
+        with self.lock:
+            self.messages.pop(session_id, None)
+            self.summaries.pop(session_id, None)
 
 class DatabaseManager:
     def __init__(self):
-        self.conn = sqlite3.connect(DB_FILE, check_same_thread=False)
+        # Reads happen here (GUI and summarizer threads); all writes go through the writer thread
+        self.conn = connect()
+        self.read_lock = threading.Lock()
+        self.history_cache = SessionHistoryCache()
+        # Queuing a message and counting it in the cache version happen as one
+        # step, so a concurrent cold load sees both or neither
+        self.history_lock = threading.Lock()
         self.create_tables()
+        self.writer = DatabaseWriter()
+        self.writer.start()
+        atexit.register(self.close)
+
+    def close(self):
+        """Commits whatever is still queued."""
+        self.writer.close()
+
+    def _read(self, sql, params=()):
+        # Read-your-writes: anything queued before this read is committed first
+        self.writer.flush()
+        with self.read_lock:
+            return self.conn.execute(sql, params).fetchall()
 
     def create_tables(self):
         cursor = self.conn.cursor()
@@ -35,58 +218,132 @@ class DatabaseManager:
                 FOREIGN KEY(session_id) REFERENCES sessions(id)
             )
         ''')
-        self.conn.commit()
 
-    def create_session(self, title="New Chat"):
-        cursor = self.conn.cursor()
-        cursor.execute("INSERT INTO sessions (title) VALUES (?)", (title,))
+        # Keyset pagination walks this index backwards from the newest message
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_messages_session ON messages (session_id, id)")
+
+        # Rolling summary of everything up to through_id (older turns aren't re-sent)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS session_summaries (
+                session_id INTEGER PRIMARY KEY,
+                summary TEXT,
+                through_id INTEGER,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY(session_id) REFERENCES sessions(id)
+            )
+        ''')
         self.conn.commit()
-        return cursor.lastrowid
+
+    def create_session(self, title=DEFAULT_TITLE):
+        # The id is needed right away, so this one waits for its commit
+        return self.writer.submit(
+            lambda cursor: cursor.execute("INSERT INTO sessions (title) VALUES (?)", (title,)).lastrowid
+        ).result()
 
     def get_sessions(self):
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT id, title FROM sessions ORDER BY id DESC")
-        return cursor.fetchall()
+        return self._read("SELECT id, title FROM sessions ORDER BY id DESC")
 
     def delete_session(self, session_id):
-        cursor = self.conn.cursor()
-        cursor.execute("DELETE FROM messages WHERE session_id=?", (session_id,))
-        cursor.execute("DELETE FROM sessions WHERE id=?", (session_id,))
-        self.conn.commit()
+        def write(cursor):
+            cursor.execute("DELETE FROM messages WHERE session_id=?", (session_id,))
+            cursor.execute("DELETE FROM session_summaries WHERE session_id=?", (session_id,))
+            cursor.execute("DELETE FROM sessions WHERE id=?", (session_id,))
+        self.history_cache.invalidate(session_id)
+        return self.writer.submit(write)
 
     def add_message(self, session_id, role, content, image_path=None, file_paths=None):
-        cursor = self.conn.cursor()
+        """
+        Queues the message and returns a Future for its id. The session
+        cache is updated immediately; the cached row gets its id on commit.
+        """
         # Convert list to JSON string for storage
         files_json = json.dumps(file_paths) if file_paths else None
-        
-        cursor.execute('''
-            INSERT INTO messages (session_id, role, content, image_path, file_paths)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (session_id, role, content, image_path, files_json))
-        self.conn.commit()
-        
-        # Update session title based on first user message
-        if role == 'user':
-            # Check if title is generic
-            cursor.execute("SELECT title FROM sessions WHERE id=?", (session_id,))
-            current_title = cursor.fetchone()[0]
-            if current_title == "New Chat":
-                # Truncate content for title
-                new_title = (content[:30] + '..') if len(content) > 30 else content
-                cursor.execute("UPDATE sessions SET title=? WHERE id=?", (new_title, session_id))
-                self.conn.commit()
-
-    def get_messages(self, session_id):
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT role, content, image_path, file_paths FROM messages WHERE session_id=? ORDER BY id ASC", (session_id,))
-        rows = cursor.fetchall()
+
+        def write(cursor):
+            cursor.execute('''
+                INSERT INTO messages (session_id, role, content, image_path, file_paths)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (session_id, role, content, image_path, files_json))
+            message_id = cursor.lastrowid
+
+            # Update session title based on first user message
+            if role == 'user':
+                # Only replaces the generic title
+                cursor.execute("UPDATE sessions SET title=? WHERE id=? AND title=?",
+                               (session_title(content), session_id, DEFAULT_TITLE))
+            return message_id
+
+        message = {
+            'id': None,
+            'role': role,
+            'text': content,
+            'image_path': image_path,
+            'file_paths': list(file_paths) if file_paths else []
+        }
+        def on_written(future):
+            if future.exception() is None:
+                message['id'] = future.result()
+
+        with self.history_lock:
+            future = self.writer.submit(write)
+            self.history_cache.append(session_id, message)
+        future.add_done_callback(on_written)
+        return future
+
+    def get_image_paths(self):
+        """Every capture path still referenced by a message."""
+        rows = self._read("SELECT DISTINCT image_path FROM messages WHERE image_path IS NOT NULL")
+        return {row[0] for row in rows}
+
+    def get_summary(self, session_id):
+        """(summary, through_id) for a session, or (None, 0) if none yet."""
+        cached = self.history_cache.summaries.get(session_id)
+        if cached is not None:
+            return cached
+        rows = self._read("SELECT summary, through_id FROM session_summaries WHERE session_id=?", (session_id,))
+        result = (rows[0][0], rows[0][1]) if rows else (None, 0)
+        self.history_cache.summaries[session_id] = result
+        return result
+
+    def save_summary(self, session_id, summary, through_id):
+        self.history_cache.summaries[session_id] = (summary, through_id)
+        return self.writer.submit(lambda cursor: cursor.execute('''
+            INSERT OR REPLACE INTO session_summaries (session_id, summary, through_id, updated_at)
+            VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+        ''', (session_id, summary, through_id)))
+
+    def get_session_history(self, session_id):
+        """Every message of a session, served from memory after the first call."""
+        messages = self.history_cache.get(session_id)
+        if messages is None:
+            with self.history_lock:
+                version = self.history_cache.version(session_id)
+                messages = self.get_messages(session_id)
+            self.history_cache.put(session_id, messages, version)
+        return messages
+
+    def get_messages(self, session_id, before_id=None, limit=None):
+        """
+        Messages of a session in chronological order. With `limit`, returns
+        only the newest `limit` messages older than `before_id` (keyset
+        pagination, so a page costs the same however long the session is).
+        """
+        if limit is None and before_id is None:
+            rows = self._read("SELECT id, role, content, image_path, file_paths FROM messages WHERE session_id=? ORDER BY id ASC", (session_id,))
+        else:
+            rows = self._read(
+                "SELECT id, role, content, image_path, file_paths FROM messages "
+                "WHERE session_id=? AND id<? ORDER BY id DESC LIMIT ?",
+                (session_id, before_id if before_id is not None else 2 ** 63 - 1, limit if limit is not None else -1)
+            )[::-1]
         
         formatted = []
         for r in rows:
             formatted.append({
-                'role': r[0],
-                'text': r[1],
-                'image_path': r[2],
-                'file_paths': json.loads(r[3]) if r[3] else []
+                'id': r[0],
+                'role': r[1],
+                'text': r[2],
+                'image_path': r[3],
+                'file_paths': json.loads(r[4]) if r[4] else []
             })
         return formatted
\ No newline at end of file
@@ -0,0 +1,162 @@
+import os
+import time
+import hashlib
+import logging
+
+from .extractors import extract_text
+from .sqlite_cache import SQLiteCache, cache_path, lazy_instance
+
+CACHE_FILE = cache_path("extract_cache.db")
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_MAX_ENTRIES = 500
+
+
+def hash_file(path, chunk_size=1024 * 1024):
+    h = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class ExtractionCache(SQLiteCache):
+    """
+    Persistent cache of text extracted from attached files.
+    (path, size, mtime) resolves to a content hash without re-reading the
+    file; the text itself is stored per content hash, so copies and renames
+    of the same document hit too. Extractions stopped at a budget are kept
+    as well, marked partial, and serve any request up to that budget. Least
+    recently used entries are evicted once the cache exceeds max_bytes or
+    max_entries.
+    """
+    SCHEMA = (
+        '''
+            CREATE TABLE IF NOT EXISTS file_index (
+                path TEXT PRIMARY KEY,
+                size INTEGER,
+                mtime REAL,
+                content_hash TEXT
+            )
+        ''',
+        '''
+            CREATE TABLE IF NOT EXISTS extracts (
+                content_hash TEXT PRIMARY KEY,
+                text TEXT,
+                nbytes INTEGER,
+                last_used REAL
+            )
+        ''',
+        # Extracts cut off at a budget; absent for complete ones
+        '''
+            CREATE TABLE IF NOT EXISTS partial_extracts (
+                content_hash TEXT PRIMARY KEY,
+                budget INTEGER
+            )
+        ''',
+    )
+
+    def __init__(self, db_file=CACHE_FILE, max_bytes=DEFAULT_MAX_BYTES, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        super().__init__(db_file)
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def content_hash(self, path):
+        """Hash for the file, re-reading it only when size or mtime changed."""
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT content_hash FROM file_index WHERE path=? AND size=? AND mtime=?",
+                (path, st.st_size, st.st_mtime)
+            ).fetchone()
+        if row:
+            return row[0]
+
+        digest = hash_file(path)
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO file_index (path, size, mtime, content_hash) VALUES (?, ?, ?, ?)",
+                (path, st.st_size, st.st_mtime, digest)
+            )
+            self.conn.commit()
+        return digest
+
+    def get(self, digest, budget=None):
+        """Cached text, or None if there is none or only a partial one shorter than `budget`."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT e.text, p.budget FROM extracts e LEFT JOIN partial_extracts p USING (content_hash) "
+                "WHERE e.content_hash=?", (digest,)
+            ).fetchone()
+            if row is None or (row[1] is not None and (budget is None or budget > row[1])):
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.conn.execute("UPDATE extracts SET last_used=? WHERE content_hash=?", (time.time(), digest))
+            self.conn.commit()
+            return row[0]
+
+    def put(self, digest, text, budget=None):
+        """Stores an extraction; with `budget` it is partial, cut off at that many characters."""
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO extracts (content_hash, text, nbytes, last_used) VALUES (?, ?, ?, ?)",
+                (digest, text, len(text.encode("utf-8", errors="ignore")), time.time())
+            )
+            if budget is None:
+                self.conn.execute("DELETE FROM partial_extracts WHERE content_hash=?", (digest,))
+            else:
+                self.conn.execute("INSERT OR REPLACE INTO partial_extracts (content_hash, budget) VALUES (?, ?)",
+                                  (digest, budget))
+            self._evict()
+            self.conn.commit()
+
+    def _evict(self):
+        count, total = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(nbytes), 0) FROM extracts").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+
+        rows = self.conn.execute("SELECT content_hash, nbytes FROM extracts ORDER BY last_used ASC").fetchall()
+        evicted = []
+        for digest, nbytes in rows:
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            evicted.append((digest,))
+            count -= 1
+            total -= nbytes
+        self.conn.executemany("DELETE FROM extracts WHERE content_hash=?", evicted)
+        self.conn.executemany("DELETE FROM partial_extracts WHERE content_hash=?", evicted)
+        self.conn.executemany("DELETE FROM file_index WHERE content_hash=?", evicted)
+        logging.info(f"Extraction cache: evicted {len(evicted)} entr(ies)")
+
+    def get_or_extract(self, path, extract, budget=None):
+        """
+        Cached text for `path`, at least its first `budget` characters. On a
+        miss extract(path) must return (text, complete); incomplete results
+        are stored as partial for `budget`, and exceptions are never cached.
+        """
+        digest = self.content_hash(path)
+        text = self.get(digest, budget)
+        hit = text is not None
+        if not hit:
+            text, complete = extract(path)
+            self.put(digest, text, None if complete else budget)
+        logging.info(f"Extraction cache {'hit' if hit else 'miss'} for {os.path.basename(path)}: "
+                     f"hit rate {self.hit_rate:.0%} ({self.hits}/{self.hits + self.misses})")
+        return text
+
+
+get_extraction_cache = lazy_instance(ExtractionCache)
+
+
+def cached_text(path, budget=None):
+    """Extracted text of a file, at most `budget` characters, through the cache. Raises on failure."""
+    text = get_extraction_cache().get_or_extract(path, lambda p: extract_text(p, budget), budget)
+    return text[:budget]
@@ -0,0 +1,165 @@
+import os
+import atexit
+import logging
+import zipfile
+import threading
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# PDFs shorter than this are parsed inline; spawning workers costs more than it saves
+PARALLEL_MIN_PAGES = 24
+PAGES_PER_TASK = 8
+MAX_WORKERS = min(4, os.cpu_count() or 1)
+
+TEXT_EXTENSIONS = ['.txt', '.md', '.py', '.js', '.html', '.css', '.json', '.xml', '.yaml', '.cpp', '.h']
+
+# {".ext": extractor(path) -> iterator of text pieces, in document order}
+EXTRACTORS = {}
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def register_extractor(*extensions):
+    """Registers a generator function as the extractor for the given extensions."""
+    def decorator(func):
+        for ext in extensions:
+            EXTRACTORS[ext.lower()] = func
+        return func
+    return decorator
+
+
+def is_supported(path):
+    return os.path.splitext(path)[1].lower() in EXTRACTORS
+
+
+def iter_extract(path):
+    """Yields the text of a file piece by piece (pages, paragraphs, ...)."""
+    ext = os.path.splitext(path)[1].lower()
+    extractor = EXTRACTORS.get(ext)
+    if extractor is None:
+        raise ValueError(f"Unsupported file type: {ext}")
+    return extractor(path)
+
+
+def extract_text(path, budget=None):
+    """
+    Returns (text, complete). Pieces are consumed in order and extraction
+    stops as soon as `budget` characters are collected, so a long document
+    costs no more than the context it can actually fill.
+    """
+    pieces = []
+    total = 0
+    stream = iter_extract(path)
+    try:
+        for piece in stream:
+            if not piece:
+                continue
+            pieces.append(piece)
+            total += len(piece) + 1
+            if budget is not None and total >= budget:
+                logging.info(f"Extraction of {os.path.basename(path)} stopped at budget ({budget} chars)")
+                return "\n".join(pieces)[:budget], False
+    finally:
+        stream.close()
+    return "\n".join(pieces), True
+
+
+# --- Process Pool ---
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=MAX_WORKERS)
+            atexit.register(_shutdown_pool)
+        return _pool
+
+
+def _shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def _extract_pdf_pages(path, start, stop):
+    """Runs in a worker process: text of pages [start, stop)."""
+    from pypdf import PdfReader
+    reader = PdfReader(path)
+    return [reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+
+# --- Extractors ---
+@register_extractor(*TEXT_EXTENSIONS)
+def extract_plain(path, chunk_size=64 * 1024):
+    with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+        for chunk in iter(lambda: f.read(chunk_size), ""):
+            yield chunk
+
+
+@register_extractor('.pdf')
+def extract_pdf(path):
+    """
+    Streams page text in order. Large documents are split into page ranges
+    parsed in parallel worker processes; only a small window of ranges is
+    in flight, so stopping early leaves the rest of the file untouched.
+    """
+    from pypdf import PdfReader
+    reader = PdfReader(path)
+    page_count = len(reader.pages)
+
+    if page_count < PARALLEL_MIN_PAGES or MAX_WORKERS < 2:
+        for page in reader.pages:
+            yield page.extract_text() or ""
+        return
+
+    ranges = [(start, min(start + PAGES_PER_TASK, page_count))
+              for start in range(0, page_count, PAGES_PER_TASK)]
+    window = MAX_WORKERS * 2
+    pending = []
+    next_range = 0
+    done_pages = 0
+    try:
+        pool = _get_pool()
+        while next_range < len(ranges) or pending:
+            while next_range < len(ranges) and len(pending) < window:
+                pending.append(pool.submit(_extract_pdf_pages, path, *ranges[next_range]))
+                next_range += 1
+            for text in pending.pop(0).result():
+                done_pages += 1
+                yield text
+    except BrokenProcessPool as e:
+        # Worker processes can't start (e.g. restricted environment); finish inline
+        logging.warning(f"PDF process pool unavailable, extracting inline: {e}")
+        _shutdown_pool()
+        for page in reader.pages[done_pages:]:
+            yield page.extract_text() or ""
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+
+@register_extractor('.docx')
+def extract_docx(path):
+    """Paragraph text from word/document.xml, streamed without loading the whole tree."""
+    with zipfile.ZipFile(path) as archive:
+        with archive.open("word/document.xml") as xml:
+            parts = []
+            for event, elem in ET.iterparse(xml, events=("end",)):
+                if elem.tag == f"{_W}t":
+                    parts.append(elem.text or "")
+                elif elem.tag == f"{_W}tab":
+                    parts.append("\t")
+                elif elem.tag in (f"{_W}br", f"{_W}cr"):
+                    parts.append("\n")
+                elif elem.tag == f"{_W}p":
+                    yield "".join(parts)
+                    parts = []
+                    elem.clear()
+                elif elem.tag == f"{_W}body":
+                    elem.clear()
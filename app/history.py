@@ -0,0 +1,95 @@
+import logging
+
+DEFAULT_CHECKPOINT_INTERVAL = 20           # committed items between raster checkpoints
+DEFAULT_MEMORY_BUDGET = 96 * 1024 * 1024   # bytes shared by checkpoints and the redo stack
+DEFAULT_MAX_REDO = 200
+
+
+class Checkpoint:
+    __slots__ = ("order", "tiles", "nbytes")
+
+    def __init__(self, order, tiles, tile_size):
+        self.order = order  # TiledLayer order of the newest item baked in
+        self.tiles = tiles  # {(tx, ty): QPixmap}
+        self.nbytes = len(tiles) * tile_size * tile_size * 4
+
+
+class UndoHistory:
+    """
+    Undo engine for the annotation canvas.
+    Every `checkpoint_interval` commits the tiled layer is snapshotted, so
+    removing an item restores the newest checkpoint older than it and only
+    replays the tail. Checkpoints and redo entries share one memory budget;
+    the oldest checkpoints are evicted first, then the deepest redo entries.
+    """
+    def __init__(self, layer, checkpoint_interval=DEFAULT_CHECKPOINT_INTERVAL,
+                 memory_budget=DEFAULT_MEMORY_BUDGET, max_redo=DEFAULT_MAX_REDO):
+        self.layer = layer
+        self.checkpoint_interval = checkpoint_interval
+        self.memory_budget = memory_budget
+        self.max_redo = max_redo
+
+        self.checkpoints = []   # oldest first
+        self.redo_stack = []
+        self.redo_bytes = 0
+
+    @property
+    def checkpoint_bytes(self):
+        return sum(cp.nbytes for cp in self.checkpoints)
+
+    def record_commit(self):
+        """Called after an item lands on the layer; takes a checkpoint when due."""
+        last_order = self.checkpoints[-1].order if self.checkpoints else 0
+        if self.layer.counter - last_order >= self.checkpoint_interval:
+            order, tiles = self.layer.snapshot()
+            self.checkpoints.append(Checkpoint(order, tiles, self.layer.tile_size))
+            self._enforce_budget()
+
+    def invalidate_from(self, order):
+        """Drops checkpoints that baked in an item at or after `order`."""
+        self.checkpoints = [cp for cp in self.checkpoints if cp.order < order]
+
+    def checkpoint_before(self, order):
+        """Newest checkpoint that predates `order`, or None to replay from scratch."""
+        for cp in reversed(self.checkpoints):
+            if cp.order < order:
+                return cp
+        return None
+
+    def push_redo(self, item):
+        self.redo_stack.append(item)
+        self.redo_bytes += item.nbytes
+        self._enforce_budget()
+
+    def pop_redo(self):
+        if not self.redo_stack:
+            return None
+        item = self.redo_stack.pop()
+        self.redo_bytes -= item.nbytes
+        return item
+
+    def clear_redo(self):
+        self.redo_stack.clear()
+        self.redo_bytes = 0
+
+    def clear(self):
+        self.checkpoints.clear()
+        self.clear_redo()
+
+    def _drop_oldest_redo(self):
+        item = self.redo_stack.pop(0)
+        self.redo_bytes -= item.nbytes
+
+    def _enforce_budget(self):
+        while len(self.redo_stack) > self.max_redo:
+            self._drop_oldest_redo()
+
+        evicted = 0
+        while self.checkpoints and self.checkpoint_bytes + self.redo_bytes > self.memory_budget:
+            self.checkpoints.pop(0)
+            evicted += 1
+        while self.redo_stack and self.redo_bytes > self.memory_budget:
+            self._drop_oldest_redo()
+
+        if evicted:
+            logging.debug(f"Undo history over budget, evicted {evicted} checkpoint(s)")
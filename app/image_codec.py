@@ -0,0 +1,130 @@
+import io
+import math
+import logging
+import threading
+from collections import OrderedDict
+from PIL import Image, ImageChops, ImageStat, features
+
+# Inline image formats each provider accepts
+PROVIDER_FORMATS = {
+    "gemini": ("png", "webp", "jpeg"),
+    "ollama": ("png", "jpeg"),
+}
+DEFAULT_FORMATS = ("png", "jpeg")
+
+MIME_TYPES = {"png": "image/png", "webp": "image/webp", "jpeg": "image/jpeg"}
+
+# Below ~38 dB small UI text starts to smear for vision models
+MIN_PSNR = 38.0
+
+# Side of the centre crop the candidates are benchmarked on
+PROBE_SIZE = 768
+
+# (name, format, save params, lossless)
+CANDIDATES = [
+    ("png-fast", "png", {"compress_level": 1}, True),
+    ("png", "png", {"compress_level": 6}, True),
+    ("png-max", "png", {"compress_level": 9, "optimize": True}, True),
+    ("png-quant", "png", {"compress_level": 6}, False),
+    ("webp-lossless", "webp", {"lossless": True, "quality": 80, "method": 4}, True),
+    ("webp", "webp", {"quality": 90, "method": 4}, False),
+    ("jpeg", "jpeg", {"quality": 90, "optimize": True}, False),
+]
+
+# {(path, provider, part, size): codec name} for recently encoded captures
+codec_choices = OrderedDict()
+_codec_choices_lock = threading.Lock()
+CODEC_CHOICES_SIZE = 256
+
+
+class EncodedImage:
+    __slots__ = ("data", "mime", "codec")
+
+    def __init__(self, data, mime, codec):
+        self.data = data
+        self.mime = mime
+        self.codec = codec
+
+
+def _encode(image, name, fmt, params):
+    if name == "png-quant":
+        image = image.quantize(colors=256, method=Image.Quantize.FASTOCTREE)
+    buffer = io.BytesIO()
+    image.save(buffer, format=fmt.upper(), **params)
+    return buffer.getvalue()
+
+
+def _psnr(original, data):
+    decoded = Image.open(io.BytesIO(data)).convert("RGB")
+    stat = ImageStat.Stat(ImageChops.difference(original, decoded))
+    mse = sum(rms * rms for rms in stat.rms) / len(stat.rms)
+    if mse == 0:
+        return math.inf
+    return 10 * math.log10(255 * 255 / mse)
+
+
+def _probe_region(image):
+    w, h = image.size
+    if w <= PROBE_SIZE and h <= PROBE_SIZE:
+        return image
+    left = max(0, (w - PROBE_SIZE) // 2)
+    top = max(0, (h - PROBE_SIZE) // 2)
+    return image.crop((left, top, left + min(w, PROBE_SIZE), top + min(h, PROBE_SIZE)))
+
+
+def _available(fmt):
+    return fmt != "webp" or features.check("webp")
+
+
+def choose_codec(image, provider, min_psnr=MIN_PSNR):
+    """
+    Benchmarks every candidate the provider accepts on a centre crop of the
+    capture and returns the name of the smallest one that meets min_psnr.
+    """
+    allowed = PROVIDER_FORMATS.get(provider, DEFAULT_FORMATS)
+    probe = _probe_region(image)
+
+    best_name, best_size = "png", None
+    for name, fmt, params, lossless in CANDIDATES:
+        if fmt not in allowed or not _available(fmt):
+            continue
+        try:
+            data = _encode(probe, name, fmt, params)
+        except Exception as e:
+            logging.debug(f"Codec {name} unavailable: {e}")
+            continue
+        if not lossless and _psnr(probe, data) < min_psnr:
+            continue
+        if best_size is None or len(data) < best_size:
+            best_name, best_size = name, len(data)
+    return best_name
+
+
+def encode_image(image, codec):
+    for name, fmt, params, _ in CANDIDATES:
+        if name == codec:
+            return EncodedImage(_encode(image, name, fmt, params), MIME_TYPES[fmt], name)
+    raise ValueError(f"Unknown codec: {codec}")
+
+
+def encode_for_provider(image, provider, key):
+    """
+    Encodes an image with the cheapest acceptable codec for the provider.
+    The benchmark runs once per `key`, which must tell apart every tile
+    and prepared size of a capture (image_prep uses (path, provider, part, size)).
+    """
+    with _codec_choices_lock:
+        codec = codec_choices.get(key)
+        if codec is not None:
+            codec_choices.move_to_end(key)
+    if codec is None:
+        codec = choose_codec(image, provider)
+        with _codec_choices_lock:
+            codec_choices[key] = codec
+            while len(codec_choices) > CODEC_CHOICES_SIZE:
+                codec_choices.popitem(last=False)
+
+    encoded = encode_image(image, codec)
+    logging.info(f"Encoded {key[0]} for {provider} as {codec}: "
+                 f"{len(encoded.data)} bytes ({image.size[0]}x{image.size[1]})")
+    return encoded
@@ -0,0 +1,193 @@
+import os
+import re
+import math
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from PIL import Image, ImageStat
+
+from .image_codec import encode_for_provider
+
+# (max_megapixels, max_edge) per provider, looked up with lookup_model_budget()
+IMAGE_BUDGETS = {
+    "gemini": {"default": (3.2, 3072)},
+    "ollama": {"default": (1.0, 1344), "llava": (0.45, 672), "llama3.2-vision": (1.3, 1120)},
+}
+DEFAULT_BUDGET = (2.0, 2048)
+
+# Grabs wider than this are multi-monitor; split them rather than shrink text away
+WIDE_ASPECT = 2.6
+MAX_TILES = 2
+BLANK_STDDEV = 6.0  # tiles flatter than this (idle wallpaper, empty editor) are dropped
+
+PREPARED_CACHE_SIZE = 32
+PAYLOAD_CACHE_BYTES = 64 * 1024 * 1024
+
+_prepared = OrderedDict()  # {(path, mtime, budget): [PIL.Image, ...]}
+_prepared_lock = threading.Lock()
+
+# Capture store names are unique and their files never change, so the name identifies the content
+_HASH_NAME = re.compile(r"^[0-9a-f]{40}$")
+_digests = {}  # {(path, mtime, size): hexdigest} for files named otherwise
+
+
+class PayloadCache:
+    """
+    Byte-bounded LRU of ready-to-send image parts, keyed by
+    (image hash, provider, budget), so a multi-turn image conversation
+    doesn't re-read and re-encode the same captures on every message.
+    """
+    def __init__(self, max_bytes=PAYLOAD_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # {key: (parts, nbytes)}
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, parts, nbytes):
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.total_bytes -= old[1]
+            self.entries[key] = (parts, nbytes)
+            self.total_bytes += nbytes
+            while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.total_bytes -= evicted
+
+
+payload_cache = PayloadCache()
+
+
+def image_digest(path):
+    stem = os.path.splitext(os.path.basename(path))[0]
+    if _HASH_NAME.match(stem):
+        return stem
+    st = os.stat(path)
+    key = (path, st.st_mtime, st.st_size)
+    digest = _digests.get(key)
+    if digest is None:
+        with open(path, "rb") as f:
+            digest = hashlib.blake2b(f.read(), digest_size=20).hexdigest()
+        _digests[key] = digest
+    return digest
+
+
+def lookup_model_budget(table, provider, model, default):
+    """
+    Per-model entry of a {provider: {model_prefix: value}} table. Model keys
+    match by prefix, the longest wins; "default" covers everything else from
+    that provider.
+    """
+    budgets = table.get(provider)
+    if not budgets:
+        return default
+    model = (model or "").lower()
+    best_key = None
+    for key in budgets:
+        if key != "default" and model.startswith(key) and (best_key is None or len(key) > len(best_key)):
+            best_key = key
+    return budgets.get(best_key or "default", default)
+
+
+def get_budget(provider, model):
+    return lookup_model_budget(IMAGE_BUDGETS, provider, model, DEFAULT_BUDGET)
+
+
+def _fit(image, max_megapixels, max_edge):
+    w, h = image.size
+    scale = min(1.0, max_edge / max(w, h), math.sqrt(max_megapixels * 1_000_000 / (w * h)))
+    if scale >= 1.0:
+        return image
+    size = (max(1, int(w * scale)), max(1, int(h * scale)))
+    # reducing_gap lets PIL shrink by whole factors first, which is much faster
+    return image.resize(size, Image.Resampling.BILINEAR, reducing_gap=2.0)
+
+
+def tile_layout(w, h):
+    """(tile count, tile width) a very wide w x h grab is split into."""
+    count = max(2, round((w / h) / (16 / 9)))
+    return count, math.ceil(w / count)
+
+
+def _select_tiles(image):
+    """Splits a very wide grab into roughly 16:9 tiles and keeps the busiest ones in order."""
+    w, h = image.size
+    count, tile_w = tile_layout(w, h)
+    tiles = [image.crop((i * tile_w, 0, min(w, (i + 1) * tile_w), h)) for i in range(count)]
+
+    scored = []
+    for i, tile in enumerate(tiles):
+        thumb = tile.convert("L")
+        thumb.thumbnail((128, 128))
+        scored.append((ImageStat.Stat(thumb).stddev[0], i))
+
+    busy = [entry for entry in scored if entry[0] >= BLANK_STDDEV] or scored
+    keep = sorted(i for _, i in sorted(busy, reverse=True)[:MAX_TILES])
+    logging.info(f"Wide capture split into {count} tiles, keeping {keep}")
+    return [tiles[i] for i in keep]
+
+
+def prepare_image(path, provider, model):
+    """
+    Returns the capture as a list of images within the provider/model budget.
+    Results are cached per (file, budget), so later turns reuse them.
+    """
+    budget = get_budget(provider, model)
+    key = (path, os.path.getmtime(path), budget)
+    with _prepared_lock:
+        if key in _prepared:
+            _prepared.move_to_end(key)
+            return _prepared[key]
+
+    with Image.open(path) as img:
+        image = img.convert("RGB")
+
+    w, h = image.size
+    parts = _select_tiles(image) if w / h > WIDE_ASPECT else [image]
+    prepared = [_fit(part, *budget) for part in parts]
+    logging.info(f"Prepared {os.path.basename(path)} for {provider}/{model}: "
+                 f"{w}x{h} -> {[p.size for p in prepared]}")
+
+    with _prepared_lock:
+        _prepared[key] = prepared
+        while len(_prepared) > PREPARED_CACHE_SIZE:
+            _prepared.popitem(last=False)
+    return prepared
+
+
+def prepare_payload(path, provider, model):
+    """Budgeted and re-encoded image parts for one stored capture."""
+    return [encode_for_provider(image, provider, (path, provider, i, image.size))
+            for i, image in enumerate(prepare_image(path, provider, model))]
+
+
+def cached_payload(path, provider, model, build_part):
+    """
+    Ready-to-send parts for a capture. `build_part(encoded)` turns an
+    EncodedImage into the provider object (types.Part, base64 str, ...);
+    its results are cached, so a hit never touches the file.
+    """
+    key = (image_digest(path), provider, get_budget(provider, model))
+    parts = payload_cache.get(key)
+    if parts is not None:
+        return parts
+
+    encoded = prepare_payload(path, provider, model)
+    parts = [build_part(e) for e in encoded]
+    payload_cache.put(key, parts, sum(len(e.data) for e in encoded))
+    logging.debug(f"Payload cache: {payload_cache.hits} hits / {payload_cache.misses} misses, "
+                  f"{payload_cache.total_bytes} bytes")
+    return parts
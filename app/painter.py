@@ -1,7 +1,12 @@
-from PyQt6.QtCore import Qt, QPoint, QPointF, QRect, QRectF
-from PyQt6.QtGui import QPainter, QColor, QPen, QPainterPath, QPixmap
+from PyQt6.QtCore import Qt, QPoint, QPointF, QRect
+from PyQt6.QtGui import QPainter, QColor, QPen
 import math
+import logging
 from .tool_state import ToolMode, ShapeType
+from .strokes import Stroke, Shape
+from .spatial_index import SpatialGrid
+from .tile_layer import TiledLayer
+from .history import UndoHistory
 
 class Painter:
     def __init__(self, parent, tool_state):
@@ -9,77 +14,119 @@ class Painter:
         self.tool_state = tool_state
 
         self.strokes = []   
-        self.redo_stack = []
         self.drawing = False
         self.current_stroke = None
         
         self.shape_start = None
         self.shape_preview = None
 
-        self.canvas_pixmap = None 
+        # Capture region dragged out in REGION mode (widget coordinates)
+        self.region_start = None
+        self.region = None
 
-    def _ensure_canvas_size(self):
-        parent_size = self.parent.size()
-        if self.canvas_pixmap is None or self.canvas_pixmap.size() != parent_size:
-            new_pixmap = QPixmap(parent_size)
-            new_pixmap.fill(Qt.GlobalColor.transparent)
-            
-            if self.strokes:
-                painter = QPainter(new_pixmap)
-                painter.setRenderHint(QPainter.RenderHint.Antialiasing)
-                self._redraw_all_strokes(painter)
-                painter.end()
-                
-            self.canvas_pixmap = new_pixmap
+        # Committed items are cached in tiles; only touched tiles re-render
+        self.layer = TiledLayer(self._draw_item)
+        self.history = UndoHistory(self.layer)
+        self.index = SpatialGrid()
 
     def clear(self):
         """Clears both the data history and the visual cache layer."""
         self.strokes.clear()
-        self.redo_stack.clear()
-        if self.canvas_pixmap:
-            self.canvas_pixmap.fill(Qt.GlobalColor.transparent)
+        self.history.clear()
+        self.index.clear()
+        self.layer.clear()
+        self.region_start = None
+        self.region = None
         self.parent.update()
 
     def undo(self):
         if self.strokes:
-            self.redo_stack.append(self.strokes.pop())
-            self._refresh_canvas_layer()
-            self.parent.update()
+            item = self.strokes.pop()
+            self._remove_items([item])
+            self.history.push_redo(item)
+            self.parent.update(self._item_bounds(item))
 
     def redo(self):
-        if self.redo_stack:
-            self.strokes.append(self.redo_stack.pop())
-            self._refresh_canvas_layer()
-            self.parent.update()
-
-    def _refresh_canvas_layer(self):
-        if self.canvas_pixmap:
-            self.canvas_pixmap.fill(Qt.GlobalColor.transparent)
-            painter = QPainter(self.canvas_pixmap)
-            painter.setRenderHint(QPainter.RenderHint.Antialiasing)
-            self._redraw_all_strokes(painter)
-            painter.end()
-
-    def _redraw_all_strokes(self, painter):
+        item = self.history.pop_redo()
+        if item is not None:
+            self._commit_item(item)
+            self.parent.update(self._item_bounds(item))
+
+    def _commit_item(self, item):
+        """Appends an item to the history, the spatial index and the tile cache."""
+        self.strokes.append(item)
+        self._index_item(item)
+        self.layer.add_item(item, self._item_bounds(item))
+        if item.kind == "stroke":
+            # The tiles hold the pixels now; re-renders build a temporary path
+            item.release_path()
+        self.history.record_commit()
+
+    def _remove_items(self, items):
+        """Drops items from the index and re-renders the tiles they covered."""
+        for item in items:
+            self.index.remove(item)
+        # Restore the newest checkpoint older than every removed item, replay the rest
+        oldest = min(self.layer.order_of(item) for item in items)
+        self.history.invalidate_from(oldest)
+        self.layer.remove_items(items, self.history.checkpoint_before(oldest))
+
+    def _item_bounds(self, item):
+        """Widget-space rect covering everything _draw_item paints for this item."""
+        pad = item.size // 2 + 2
+        if item.kind == "stroke":
+            rect = item.bounds()
+        else:
+            rect = item.rect()
+            if item.shape == ShapeType.ARROW:
+                pad += max(12, item.size * 3)
+        return rect.adjusted(-pad, -pad, pad, pad)
+
+    def content_bounds(self):
+        """Union of the painted bounds of every committed item (null if empty)."""
+        bounds = QRect()
         for item in self.strokes:
-            self._draw_item(painter, item)
+            bounds = bounds.united(self._item_bounds(item))
+        return bounds
+
+    def _region_dirty_rect(self, region):
+        return region.adjusted(-3, -3, 3, 3) if region is not None else QRect()
+
+    def _preview_item(self):
+        """The translucent shape currently being dragged out, or None."""
+        if not (self.tool_state.mode == ToolMode.SHAPE and self.shape_start and self.shape_preview):
+            return None
+        color = QColor(self.tool_state.color)
+        color.setAlpha(150)
+        return Shape(self.tool_state.shape_type, self.shape_start, self.shape_preview,
+                     color, self.tool_state.brush_size)
+
+    def _eraser_cursor_rect(self, pos):
+        r = self.tool_state.brush_size * 4 + 2
+        return QRect(pos.x() - r, pos.y() - r, r * 2, r * 2)
+
+    def update_eraser_cursor(self, old_pos, new_pos):
+        """Repaints only the area the eraser ring moved across."""
+        self.parent.update(self._eraser_cursor_rect(old_pos).united(self._eraser_cursor_rect(new_pos)))
+
+    def _index_item(self, item):
+        """Registers an item's segments (or shape bounds) in the spatial index."""
+        self.index.insert(item, item.segment_boxes())
 
     def _draw_item(self, painter, item):
-        pen = QPen(item["color"], item["size"], Qt.PenStyle.SolidLine, Qt.PenCapStyle.RoundCap, Qt.PenJoinStyle.RoundJoin)
+        pen = QPen(item.color, item.size, Qt.PenStyle.SolidLine, Qt.PenCapStyle.RoundCap, Qt.PenJoinStyle.RoundJoin)
         painter.setPen(pen)
         painter.setBrush(Qt.BrushStyle.NoBrush)
 
-        if item["type"] == "stroke":
-            painter.drawPath(item["path"])
-        elif item["type"] == "shape":
+        if item.kind == "stroke":
+            painter.drawPath(item.path)
+        elif item.kind == "shape":
             self._draw_shape(painter, item)
 
     def mouse_press(self, event):
         if event.button() != Qt.MouseButton.LeftButton:
             return
 
-        self._ensure_canvas_size()
-
         # --- ENUM USAGE ---
         if self.tool_state.mode == ToolMode.ERASE:
             self.drawing = True
@@ -88,26 +135,25 @@ class Painter:
 
         if self.tool_state.mode == ToolMode.DRAW:
             self.drawing = True
-            self.redo_stack.clear()
+            self.history.clear_redo()
             
             start_pt = event.position().toPoint()
-            path = QPainterPath()
-            path.moveTo(QPointF(start_pt))
-            
-            self.current_stroke = {
-                "type": "stroke",
-                "path": path, 
-                "points": [start_pt],
-                "color": QColor(self.tool_state.color),
-                "size": self.tool_state.brush_size
-            }
+            self.current_stroke = Stroke(QColor(self.tool_state.color), self.tool_state.brush_size,
+                                         (start_pt.x(), start_pt.y()))
+            self.current_stroke.keep_path()
 
         elif self.tool_state.mode == ToolMode.SHAPE:
             self.drawing = True
-            self.redo_stack.clear()
+            self.history.clear_redo()
             self.shape_start = event.position().toPoint()
             self.shape_preview = None
 
+        elif self.tool_state.mode == ToolMode.REGION:
+            self.drawing = True
+            self.parent.update(self._region_dirty_rect(self.region))
+            self.region_start = event.position().toPoint()
+            self.region = None
+
     def mouse_move(self, event):
         if not self.drawing:
             return
@@ -118,13 +164,30 @@ class Painter:
             self._erase_at_point(pos)
 
         elif self.tool_state.mode == ToolMode.DRAW and self.current_stroke:
-            self.current_stroke["points"].append(pos)
-            self.current_stroke["path"].lineTo(QPointF(pos))
-            self.parent.update()
+            last = self.current_stroke.last_point()
+            # High-rate mice and tablets report sub-pixel jitter; drop it
+            min_dist = self.tool_state.decimate_distance
+            if min_dist > 0:
+                delta = event.position() - QPointF(last)
+                if delta.x() * delta.x() + delta.y() * delta.y() < min_dist * min_dist:
+                    return
+            self.current_stroke.append(pos.x(), pos.y())
+            # Only the newest segment changed on screen
+            pad = self.current_stroke.size // 2 + 2
+            self.parent.update(QRect(last, pos).normalized().adjusted(-pad, -pad, pad, pad))
 
         elif self.tool_state.mode == ToolMode.SHAPE and self.shape_start:
+            old_preview = self._preview_item()
             self.shape_preview = pos
-            self.parent.update()
+            dirty = self._item_bounds(self._preview_item())
+            if old_preview:
+                dirty = dirty.united(self._item_bounds(old_preview))
+            self.parent.update(dirty)
+
+        elif self.tool_state.mode == ToolMode.REGION and self.region_start:
+            dirty = self._region_dirty_rect(self.region)
+            self.region = QRect(self.region_start, pos).normalized()
+            self.parent.update(dirty.united(self._region_dirty_rect(self.region)))
 
     def mouse_release(self, event):
         if not self.drawing:
@@ -133,85 +196,85 @@ class Painter:
         self.drawing = False
 
         if self.tool_state.mode == ToolMode.DRAW and self.current_stroke:
-            self.strokes.append(self.current_stroke)
-            
-            painter = QPainter(self.canvas_pixmap)
-            painter.setRenderHint(QPainter.RenderHint.Antialiasing)
-            self._draw_item(painter, self.current_stroke)
-            painter.end()
-            
+            stroke = self.current_stroke
+            dirty = self._item_bounds(stroke)
+            if self.tool_state.simplify_tolerance > 0:
+                dropped = stroke.simplify(self.tool_state.simplify_tolerance)
+                if dropped:
+                    logging.debug(f"Simplified stroke: dropped {dropped} of {len(stroke) + dropped} points")
+            self._commit_item(stroke)
+            self.parent.update(dirty.united(self._item_bounds(stroke)))
             self.current_stroke = None
-            self.parent.update()
 
         elif self.tool_state.mode == ToolMode.SHAPE and self.shape_start:
+            old_preview = self._preview_item()
+            dirty = self._item_bounds(old_preview) if old_preview else QRect()
             end_point = event.position().toPoint()
             # Threshold to prevent accidental dots
             if (end_point - self.shape_start).manhattanLength() > 5:
-                shape_data = {
-                    "type": "shape",
-                    "shape": self.tool_state.shape_type, # Stores Enum
-                    "start": self.shape_start,
-                    "end": end_point,
-                    "color": QColor(self.tool_state.color),
-                    "size": self.tool_state.brush_size
-                }
-                self.strokes.append(shape_data)
-                
-                painter = QPainter(self.canvas_pixmap)
-                painter.setRenderHint(QPainter.RenderHint.Antialiasing)
-                self._draw_item(painter, shape_data)
-                painter.end()
+                shape_data = Shape(
+                    self.tool_state.shape_type, # Stores Enum
+                    self.shape_start,
+                    end_point,
+                    QColor(self.tool_state.color),
+                    self.tool_state.brush_size
+                )
+                self._commit_item(shape_data)
+                dirty = dirty.united(self._item_bounds(shape_data))
             
             self.shape_start = None
             self.shape_preview = None
-            self.parent.update()
+            if not dirty.isNull():
+                self.parent.update(dirty)
+
+        elif self.tool_state.mode == ToolMode.REGION and self.region_start:
+            self.region_start = None
+            # A click without a real drag clears the selection
+            if self.region is not None and (self.region.width() < 8 or self.region.height() < 8):
+                self.parent.update(self._region_dirty_rect(self.region))
+                self.region = None
 
     def _erase_at_point(self, erase_point):
-        # Optimization: Quadtree would be better, but this logic is 'okay' for small buffers
         erase_radius = self.tool_state.brush_size * 4
-        indices_to_remove = []
-        erase_rect_f = QRectF(
+        erase_rect = QRect(
             erase_point.x() - erase_radius, 
             erase_point.y() - erase_radius, 
             erase_radius * 2, 
             erase_radius * 2
         )
 
-        stroke_removed = False
-
-        for i, item in enumerate(self.strokes):
+        # Only items sharing a grid cell with the eraser are candidates
+        hit_ids = set()
+        for item in self.index.query(erase_rect):
             hit = False
-            if item["type"] == "stroke":
-                # Quick bounding box check first
-                if item["path"].controlPointRect().intersects(erase_rect_f):
-                    for point in item["points"]:
-                        # Exact check
-                        if (point - erase_point).manhattanLength() < erase_radius:
-                            hit = True
-                            break
-            elif item["type"] == "shape":
-                rect = QRect(item["start"], item["end"]).normalized()
+            if item.kind == "stroke":
+                # Exact check against the segments; simplified strokes keep few vertices
+                hit = item.hits(erase_point.x(), erase_point.y(), erase_radius)
+            elif item.kind == "shape":
+                rect = item.rect()
                 expanded = rect.adjusted(-erase_radius, -erase_radius, erase_radius, erase_radius)
                 if expanded.contains(erase_point):
                     hit = True
 
             if hit:
-                indices_to_remove.append(i)
-                stroke_removed = True
+                hit_ids.add(id(item))
 
-        for i in reversed(indices_to_remove):
-            self.strokes.pop(i)
-        
-        if stroke_removed:
-            self._refresh_canvas_layer()
-            self.parent.update()
+        if hit_ids:
+            removed = [item for item in self.strokes if id(item) in hit_ids]
+            self.strokes = [item for item in self.strokes if id(item) not in hit_ids]
+            self._remove_items(removed)
+
+            dirty = QRect()
+            for item in removed:
+                dirty = dirty.united(self._item_bounds(item))
+            self.parent.update(dirty)
 
     def paint_event(self, event):
-        # Draw the cached canvas
+        # Draw the cached canvas, limited to the region Qt asked us to repaint
+        dirty = event.rect()
         painter = QPainter(self.parent)
-        self._ensure_canvas_size()
-        if self.canvas_pixmap:
-            painter.drawPixmap(0, 0, self.canvas_pixmap)
+        painter.setClipRect(dirty)
+        self.layer.paint(painter, dirty)
 
         painter.setRenderHint(QPainter.RenderHint.Antialiasing)
         
@@ -220,32 +283,33 @@ class Painter:
             self._draw_item(painter, self.current_stroke)
             
         # Draw active shape preview
-        if self.tool_state.mode == ToolMode.SHAPE and self.shape_start and self.shape_preview:
-            preview_item = {
-                "shape": self.tool_state.shape_type,
-                "start": self.shape_start,
-                "end": self.shape_preview,
-                "color": QColor(self.tool_state.color),
-                "size": self.tool_state.brush_size,
-                "type": "shape"
-            }
-            preview_item["color"].setAlpha(150)
+        preview_item = self._preview_item()
+        if preview_item:
             self._draw_item(painter, preview_item)
         
+        # Draw capture region
+        if self.region is not None and self.region.intersects(dirty):
+            painter.setPen(QPen(QColor(255, 255, 255, 220), 1.5, Qt.PenStyle.DashLine))
+            painter.setBrush(QColor(120, 120, 255, 30))
+            painter.drawRect(self.region)
+
         # Draw Eraser Cursor
         if self.tool_state.mode == ToolMode.ERASE and hasattr(self.parent, 'last_mouse_pos'):
-            r = self.tool_state.brush_size * 4
-            painter.setPen(QPen(QColor(255, 255, 255, 180), 1, Qt.PenStyle.DashLine))
-            painter.setBrush(QColor(255, 100, 100, 50))
-            painter.drawEllipse(self.parent.last_mouse_pos, r, r)
+            if self._eraser_cursor_rect(self.parent.last_mouse_pos).intersects(dirty):
+                r = self.tool_state.brush_size * 4
+                painter.setPen(QPen(QColor(255, 255, 255, 180), 1, Qt.PenStyle.DashLine))
+                painter.setBrush(QColor(255, 100, 100, 50))
+                painter.drawEllipse(self.parent.last_mouse_pos, r, r)
+
+        painter.end()
 
     def _draw_shape(self, painter, shape):
-        pen = QPen(shape["color"], shape["size"], Qt.PenStyle.SolidLine, Qt.PenCapStyle.RoundCap, Qt.PenJoinStyle.RoundJoin)
+        pen = QPen(shape.color, shape.size, Qt.PenStyle.SolidLine, Qt.PenCapStyle.RoundCap, Qt.PenJoinStyle.RoundJoin)
         painter.setPen(pen)
         painter.setBrush(Qt.BrushStyle.NoBrush)
 
-        start, end = shape["start"], shape["end"]
-        s_type = shape["shape"]
+        start, end = shape.start, shape.end
+        s_type = shape.shape
         
         if s_type == ShapeType.RECTANGLE:
             painter.drawRect(QRect(start, end))
@@ -254,7 +318,7 @@ class Painter:
         elif s_type == ShapeType.LINE:
             painter.drawLine(start, end)
         elif s_type == ShapeType.ARROW:
-            self._draw_arrow(painter, start, end, shape["size"])
+            self._draw_arrow(painter, start, end, shape.size)
 
     def _draw_arrow(self, painter, start, end, size):
         painter.drawLine(start, end)
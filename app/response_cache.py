@@ -0,0 +1,117 @@
+import time
+import json
+import hashlib
+import logging
+
+from .image_prep import image_digest
+from .extract_cache import get_extraction_cache
+from .sqlite_cache import SQLiteCache, cache_path, lazy_instance
+
+CACHE_FILE = cache_path("response_cache.db")
+DEFAULT_TTL_SECONDS = 7 * 86400
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+
+# Cached answers are replayed in pieces this size, like a fast stream
+REPLAY_CHUNK_CHARS = 256
+
+
+def _file_digest(path, digest):
+    try:
+        return digest(path)
+    except OSError:
+        # Missing file: the path is all that identifies it
+        return f"missing:{path}"
+
+
+def conversation_key(provider, model, history, attached_files=()):
+    """
+    Deterministic key for a request: model, the packed history with
+    whitespace normalized, and the content hashes of its images and files.
+    """
+    cache = get_extraction_cache()
+    payload = {
+        "provider": provider,
+        "model": model,
+        "messages": [
+            [msg['role'], " ".join(msg['text'].split()),
+             [_file_digest(path, image_digest) for path in msg.get('images', [])]]
+            for msg in history
+        ],
+        "files": [_file_digest(path, cache.content_hash) for path in attached_files],
+    }
+    encoded = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return hashlib.blake2b(encoded, digest_size=20).hexdigest()
+
+
+class ResponseCache(SQLiteCache):
+    """
+    Opt-in cache of complete model answers, keyed by conversation_key().
+    Entries expire after ttl_seconds; past max_bytes the least recently
+    used ones are evicted.
+    """
+    SCHEMA = (
+        '''
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                model TEXT,
+                response TEXT,
+                nbytes INTEGER,
+                created_at REAL,
+                last_used REAL
+            )
+        ''',
+    )
+
+    def __init__(self, db_file=CACHE_FILE, ttl_seconds=DEFAULT_TTL_SECONDS, max_bytes=DEFAULT_MAX_BYTES):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        super().__init__(db_file)
+
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute("SELECT response, created_at FROM responses WHERE key=?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl_seconds:
+                if row is not None:
+                    self.conn.execute("DELETE FROM responses WHERE key=?", (key,))
+                    self.conn.commit()
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.conn.execute("UPDATE responses SET last_used=? WHERE key=?", (now, key))
+            self.conn.commit()
+            return row[0]
+
+    def put(self, key, model, response):
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, nbytes, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, response, len(response.encode("utf-8", errors="ignore")), now, now)
+            )
+            self._evict(now)
+            self.conn.commit()
+
+    def _evict(self, now):
+        expired = self.conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,)).rowcount
+        total = self.conn.execute("SELECT COALESCE(SUM(nbytes), 0) FROM responses").fetchone()[0]
+        evicted = []
+        if total > self.max_bytes:
+            for key, nbytes in self.conn.execute("SELECT key, nbytes FROM responses ORDER BY last_used ASC").fetchall():
+                if total <= self.max_bytes:
+                    break
+                evicted.append((key,))
+                total -= nbytes
+            self.conn.executemany("DELETE FROM responses WHERE key=?", evicted)
+        if expired or evicted:
+            logging.info(f"Response cache: dropped {expired} expired, evicted {len(evicted)}")
+
+    def replay(self, response):
+        """Splits a cached answer into stream-sized chunks."""
+        return [response[i:i + REPLAY_CHUNK_CHARS] for i in range(0, len(response), REPLAY_CHUNK_CHARS)]
+
+
+get_response_cache = lazy_instance(ResponseCache)
@@ -0,0 +1,331 @@
+import os
+import re
+import math
+import time
+import logging
+import threading
+from collections import Counter, defaultdict
+
+from .extract_cache import cached_text, get_extraction_cache
+from .extractors import is_supported
+from .sqlite_cache import SQLiteCache, cache_path, lazy_instance
+
+INDEX_FILE = cache_path("retrieval_index.db")
+
+CHUNK_CHARS = 1200
+CHUNK_OVERLAP = 200
+TOP_K = 8
+MAX_INDEX_CHARS = 5_000_000   # documents are indexed up to this many characters
+MAX_DOCUMENTS = 200
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have in is it its of on or that the this to "
+    "was were what when where which who why will with you your can do does how i me my we".split()
+)
+
+
+def tokenize(text):
+    return [t for t in _TOKEN.findall(text.lower()) if len(t) > 1 and t not in STOPWORDS]
+
+
+def chunk_text(text, size=CHUNK_CHARS, overlap=CHUNK_OVERLAP):
+    """Splits text into ~size character chunks, preferring paragraph and line breaks."""
+    chunks = []
+    start = 0
+    length = len(text)
+    while start < length:
+        end = min(start + size, length)
+        if end < length:
+            # Back up to the nearest break in the second half of the window
+            for sep in ("\n\n", "\n", ". ", " "):
+                cut = text.rfind(sep, start + size // 2, end)
+                if cut != -1:
+                    end = cut + len(sep)
+                    break
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        if end >= length:
+            break
+        start = max(end - overlap, start + 1)
+    return chunks
+
+
+class RetrievalIndex(SQLiteCache):
+    """
+    BM25 index over attached files, persisted in SQLite.
+    Documents are keyed by content hash, so a file is chunked and indexed
+    once no matter how often (or under which name) it is attached.
+    """
+    SCHEMA = (
+        '''
+            CREATE TABLE IF NOT EXISTS documents (
+                content_hash TEXT PRIMARY KEY,
+                chunk_count INTEGER,
+                total_length INTEGER,
+                char_length INTEGER,
+                last_used REAL
+            )
+        ''',
+        '''
+            CREATE TABLE IF NOT EXISTS chunks (
+                content_hash TEXT,
+                chunk_no INTEGER,
+                text TEXT,
+                length INTEGER,
+                PRIMARY KEY (content_hash, chunk_no)
+            )
+        ''',
+        '''
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT,
+                content_hash TEXT,
+                chunk_no INTEGER,
+                tf INTEGER
+            )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_postings_term ON postings (term, content_hash)",
+        "CREATE INDEX IF NOT EXISTS idx_postings_doc ON postings (content_hash)",
+    )
+
+    def __init__(self, db_file=INDEX_FILE, max_documents=MAX_DOCUMENTS):
+        self.max_documents = max_documents
+        self.pending = set()  # paths being indexed in the background
+        super().__init__(db_file)
+
+    def is_indexed(self, digest):
+        with self.lock:
+            return self.conn.execute("SELECT 1 FROM documents WHERE content_hash=?", (digest,)).fetchone() is not None
+
+    def touch(self, digest):
+        with self.lock:
+            self.conn.execute("UPDATE documents SET last_used=? WHERE content_hash=?", (time.time(), digest))
+            self.conn.commit()
+
+    def index_async(self, path):
+        """Indexes the file on a background thread, so the first turn never waits on it."""
+        path = os.path.abspath(path)
+        with self.lock:
+            if path in self.pending:
+                return
+            self.pending.add(path)
+
+        def run():
+            try:
+                self.ensure_indexed(path)
+            except Exception as e:
+                logging.warning(f"Background indexing of {os.path.basename(path)} failed: {e}")
+            finally:
+                with self.lock:
+                    self.pending.discard(path)
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def ensure_indexed(self, path):
+        """Indexes the file unless its content is already indexed. Returns its content hash."""
+        digest = get_extraction_cache().content_hash(path)
+        if self.is_indexed(digest):
+            self.touch(digest)
+            return digest
+
+        start = time.perf_counter()
+        text = cached_text(path, MAX_INDEX_CHARS)
+        chunks = chunk_text(text)
+        postings = []
+        lengths = []
+        for no, chunk in enumerate(chunks):
+            terms = Counter(tokenize(chunk))
+            lengths.append(sum(terms.values()))
+            postings.extend((term, digest, no, tf) for term, tf in terms.items())
+
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO chunks (content_hash, chunk_no, text, length) VALUES (?, ?, ?, ?)",
+                [(digest, no, chunk, lengths[no]) for no, chunk in enumerate(chunks)]
+            )
+            self.conn.executemany(
+                "INSERT INTO postings (term, content_hash, chunk_no, tf) VALUES (?, ?, ?, ?)", postings
+            )
+            self.conn.execute(
+                "INSERT OR REPLACE INTO documents (content_hash, chunk_count, total_length, char_length, last_used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (digest, len(chunks), sum(lengths), len(text), time.time())
+            )
+            self._evict()
+            self.conn.commit()
+
+        logging.info(f"Indexed {os.path.basename(path)}: {len(chunks)} chunks, {len(postings)} postings "
+                     f"in {time.perf_counter() - start:.2f}s")
+        return digest
+
+    def _evict(self):
+        rows = self.conn.execute(
+            "SELECT content_hash FROM documents ORDER BY last_used DESC LIMIT -1 OFFSET ?", (self.max_documents,)
+        ).fetchall()
+        for table in ("documents", "chunks", "postings"):
+            self.conn.executemany(f"DELETE FROM {table} WHERE content_hash=?", rows)
+        if rows:
+            logging.info(f"Retrieval index: evicted {len(rows)} document(s)")
+
+    def search(self, digests, query, k=TOP_K):
+        """
+        Top-k chunks of the given documents for the query, best first.
+        Returns [(score, content_hash, chunk_no)].
+        """
+        terms = set(tokenize(query))
+        if not digests or not terms:
+            return []
+
+        marks = ",".join("?" * len(digests))
+        with self.lock:
+            n_chunks, total_length = self.conn.execute(
+                f"SELECT SUM(chunk_count), SUM(total_length) FROM documents WHERE content_hash IN ({marks})",
+                digests
+            ).fetchone()
+            if not n_chunks:
+                return []
+            avg_length = (total_length or 1) / n_chunks
+
+            term_postings = [
+                self.conn.execute(
+                    "SELECT p.content_hash, p.chunk_no, p.tf, c.length FROM postings p "
+                    "JOIN chunks c ON c.content_hash = p.content_hash AND c.chunk_no = p.chunk_no "
+                    f"WHERE p.term=? AND p.content_hash IN ({marks})",
+                    (term, *digests)
+                ).fetchall()
+                for term in terms
+            ]
+
+        scores = defaultdict(float)
+        for rows in term_postings:
+            if not rows:
+                continue
+            idf = math.log(1 + (n_chunks - len(rows) + 0.5) / (len(rows) + 0.5))
+            for d, no, tf, length in rows:
+                norm = K1 * (1 - B + B * length / avg_length)
+                scores[(d, no)] += idf * tf * (K1 + 1) / (tf + norm)
+
+        ranked = sorted(((score, d, no) for (d, no), score in scores.items()), reverse=True)
+        return ranked[:k]
+
+    def document_info(self, digest):
+        """(chunk_count, char_length) of an indexed document."""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT chunk_count, char_length FROM documents WHERE content_hash=?", (digest,)
+            ).fetchone() or (0, 0)
+
+    def chunks(self, digest, numbers):
+        """[(chunk_no, text)] for the given chunk numbers, in document order."""
+        numbers = sorted(numbers)
+        marks = ",".join("?" * len(numbers))
+        with self.lock:
+            return self.conn.execute(
+                f"SELECT chunk_no, text FROM chunks WHERE content_hash=? AND chunk_no IN ({marks}) ORDER BY chunk_no",
+                (digest, *numbers)
+            ).fetchall()
+
+
+get_retrieval_index = lazy_instance(RetrievalIndex)
+
+
+def _file_block(filename, body, note=""):
+    return f"\n--- FILE: {filename}{note} ---\n{body}\n"
+
+
+def build_file_context(paths, query, budget, k=TOP_K):
+    """
+    Context block for the attached files, at most `budget` characters.
+    Files that fit are sent whole, smallest first. The remaining budget is
+    shared among the larger files, which get their top BM25 chunks for the
+    query in document order (the leading chunks when nothing matches). A
+    large file that isn't indexed yet is indexed in the background and this
+    turn gets its leading text. Every attachment appears with a marker, even
+    when nothing of it fits.
+    """
+    index = get_retrieval_index()
+    context = ""
+    small = []  # [(filename, text)]
+    large = []  # [(path, filename, text read so far)]
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        filename = os.path.basename(path)
+        if not is_supported(path):
+            context += _file_block(filename, f"[Unsupported file type: {os.path.splitext(path)[1].lower()}]")
+            continue
+        try:
+            # Bounded: a file past the budget is only read this far
+            text = cached_text(path, budget + 1)
+        except ImportError:
+            context += _file_block(filename, "[Error: pypdf library not installed. Cannot read PDF.]")
+            continue
+        except Exception as e:
+            context += _file_block(filename, f"[Error reading {filename}: {str(e)}]")
+            continue
+        if len(text) <= budget:
+            small.append((filename, text))
+        else:
+            large.append((path, filename, text))
+
+    for filename, text in sorted(small, key=lambda item: len(item[1])):
+        block = _file_block(filename, text)
+        if len(context) + len(block) <= budget:
+            context += block
+        else:
+            large.append((None, filename, text))
+
+    for i, (path, filename, text) in enumerate(large):
+        share = (budget - len(context)) // (len(large) - i)
+        if path is not None and share > 0:
+            block = _excerpts(index, path, filename, text, query, share, k)
+        else:
+            block = ""
+        if not block:
+            block = _file_block(filename, "[Omitted: attachments exceed the context budget]")
+        context += block
+    return context
+
+
+def _excerpts(index, path, filename, text, query, share, k):
+    """
+    At most `share` characters of a large file: BM25 excerpts once indexed,
+    until then the start of `text`, the prefix build_file_context already read.
+    """
+    try:
+        digest = get_extraction_cache().content_hash(path)
+        if not index.is_indexed(digest):
+            index.index_async(path)
+            note = " (beginning; indexing the rest for follow-up questions)"
+            header = len(_file_block(filename, "", note))
+            return _file_block(filename, text[:max(0, share - header)], note)
+        index.touch(digest)
+    except Exception as e:
+        logging.warning(f"File context: {filename}: {e}")
+        return ""
+
+    chunk_count, _ = index.document_info(digest)
+    ranked = [no for _, _, no in index.search([digest], query, k)] or list(range(min(k, chunk_count)))
+    logging.info(f"File context: {filename}: {len(ranked)} chunk(s) of {chunk_count}")
+
+    context = _file_block(filename, "", " (excerpts)")[:-1]
+    selected = set()
+    used = len(context)
+    texts = dict(index.chunks(digest, ranked))
+    # Best first until the share is used up, then back in document order
+    for no in ranked:
+        part = f"[Part {no + 1}/{chunk_count}]\n{texts.get(no, '')}\n"
+        if used + len(part) > share:
+            break
+        selected.add(no)
+        used += len(part)
+    if not selected:
+        return ""
+    for no in sorted(selected):
+        context += f"[Part {no + 1}/{chunk_count}]\n{texts[no]}\n"
+    return context
@@ -0,0 +1,62 @@
+from collections import defaultdict
+
+
+class SpatialGrid:
+    """
+    Uniform grid index over canvas items.
+    Every item is registered in each cell its segments touch, so a query
+    only looks at the few cells under the eraser instead of the whole canvas.
+    """
+    def __init__(self, cell_size=64):
+        self.cell_size = cell_size
+        self.cells = defaultdict(set)   # {(cx, cy): {item_id, ...}}
+        self.item_cells = {}            # {item_id: {(cx, cy), ...}}
+        self.items = {}                 # {item_id: item}
+
+    def _cells_for_box(self, left, top, right, bottom):
+        cs = self.cell_size
+        for cx in range(left // cs, right // cs + 1):
+            for cy in range(top // cs, bottom // cs + 1):
+                yield (cx, cy)
+
+    def insert(self, item, boxes):
+        """Registers an item under every cell covered by the (left, top, right, bottom) boxes."""
+        item_id = id(item)
+        if item_id in self.items:
+            self.remove(item)
+
+        covered = set()
+        for box in boxes:
+            covered.update(self._cells_for_box(*box))
+
+        for cell in covered:
+            self.cells[cell].add(item_id)
+        self.item_cells[item_id] = covered
+        self.items[item_id] = item
+
+    def remove(self, item):
+        item_id = id(item)
+        for cell in self.item_cells.pop(item_id, ()):
+            bucket = self.cells.get(cell)
+            if bucket is not None:
+                bucket.discard(item_id)
+                if not bucket:
+                    del self.cells[cell]
+        self.items.pop(item_id, None)
+
+    def query(self, rect):
+        """Returns the items registered in any cell overlapping rect."""
+        found = set()
+        for cell in self._cells_for_box(rect.left(), rect.top(), rect.right(), rect.bottom()):
+            bucket = self.cells.get(cell)
+            if bucket:
+                found.update(bucket)
+        return [self.items[item_id] for item_id in found]
+
+    def clear(self):
+        self.cells.clear()
+        self.item_cells.clear()
+        self.items.clear()
+
+    def __len__(self):
+        return len(self.items)
@@ -0,0 +1,42 @@
+import os
+import threading
+
+from .database import DB_FILE, connect
+
+
+def cache_path(filename):
+    """Cache databases live next to chat_history.db."""
+    return os.path.join(os.path.dirname(os.path.abspath(DB_FILE)), filename)
+
+
+class SQLiteCache:
+    """
+    Base for the persistent caches: one connection opened through
+    database.connect() (WAL, busy_timeout), shared by every thread under
+    `lock`. Subclasses list their DDL statements in SCHEMA.
+    """
+    SCHEMA = ()
+
+    def __init__(self, db_file):
+        self.lock = threading.Lock()
+        self.conn = connect(db_file)
+        self.create_tables()
+
+    def create_tables(self):
+        for statement in self.SCHEMA:
+            self.conn.execute(statement)
+        self.conn.commit()
+
+
+def lazy_instance(factory):
+    """Getter that builds one shared instance on first use."""
+    instance = None
+    lock = threading.Lock()
+
+    def get():
+        nonlocal instance
+        with lock:
+            if instance is None:
+                instance = factory()
+            return instance
+    return get
@@ -0,0 +1,192 @@
+from array import array
+from PyQt6.QtCore import QPoint, QRect
+from PyQt6.QtGui import QPainterPath
+
+# A QPainterPath element: two doubles and a type
+PATH_ELEMENT_BYTES = 24
+
+
+def simplify_points(points, tolerance):
+    """
+    Ramer-Douglas-Peucker over a flat x, y buffer.
+    Drops every sample closer than `tolerance` pixels to the simplified line.
+    """
+    n = len(points) // 2
+    if n < 3 or tolerance <= 0:
+        return array('i', points)
+
+    keep = bytearray(n)
+    keep[0] = keep[n - 1] = 1
+    tol2 = tolerance * tolerance
+    stack = [(0, n - 1)]
+
+    while stack:
+        first, last = stack.pop()
+        x0, y0 = points[2 * first], points[2 * first + 1]
+        dx = points[2 * last] - x0
+        dy = points[2 * last + 1] - y0
+        seg_len2 = dx * dx + dy * dy
+
+        max_d2, index = 0.0, -1
+        for i in range(first + 1, last):
+            px = points[2 * i] - x0
+            py = points[2 * i + 1] - y0
+            if seg_len2 == 0:
+                d2 = px * px + py * py
+            else:
+                cross = px * dy - py * dx
+                d2 = cross * cross / seg_len2
+            if d2 > max_d2:
+                max_d2, index = d2, i
+
+        if max_d2 > tol2:
+            keep[index] = 1
+            stack.append((first, index))
+            stack.append((index, last))
+
+    out = array('i')
+    for i in range(n):
+        if keep[i]:
+            out.append(points[2 * i])
+            out.append(points[2 * i + 1])
+    return out
+
+
+def segment_distance2(px, py, x0, y0, x1, y1):
+    """Squared distance from (px, py) to the segment (x0, y0)-(x1, y1)."""
+    dx, dy = x1 - x0, y1 - y0
+    len2 = dx * dx + dy * dy
+    if len2 == 0:
+        t = 0.0
+    else:
+        t = max(0.0, min(1.0, ((px - x0) * dx + (py - y0) * dy) / len2))
+    cx = x0 + t * dx - px
+    cy = y0 + t * dy - py
+    return cx * cx + cy * cy
+
+
+class Stroke:
+    """
+    Freehand stroke. Points live in one flat array('i') of x, y pairs. Only
+    the stroke being drawn keeps a QPainterPath (extended point by point);
+    committed strokes build a temporary one whenever a tile renders them.
+    """
+    __slots__ = ("points", "color", "size", "_path", "_bounds")
+    kind = "stroke"
+
+    def __init__(self, color, size, points=()):
+        self.points = array('i', points)
+        self.color = color
+        self.size = size
+        self._path = None
+        self._bounds = None
+
+    def __len__(self):
+        return len(self.points) // 2
+
+    def append(self, x, y):
+        self.points.append(x)
+        self.points.append(y)
+        self._bounds = None
+        # Keep an already-built path in sync instead of rebuilding it
+        if self._path is not None:
+            self._path.lineTo(x, y)
+
+    def simplify(self, tolerance):
+        """Replaces the samples with their RDP simplification. Returns points dropped."""
+        before = len(self)
+        self.points = simplify_points(self.points, tolerance)
+        self._path = None
+        self._bounds = None
+        return before - len(self)
+
+    def iter_points(self):
+        """Yields (x, y) tuples."""
+        it = iter(self.points)
+        return zip(it, it)
+
+    def last_point(self):
+        return QPoint(self.points[-2], self.points[-1])
+
+    def _build_path(self):
+        path = QPainterPath()
+        it = self.iter_points()
+        first = next(it, None)
+        if first is not None:
+            path.moveTo(*first)
+            for x, y in it:
+                path.lineTo(x, y)
+        return path
+
+    @property
+    def path(self):
+        """The kept path while drawing, otherwise a temporary one."""
+        if self._path is not None:
+            return self._path
+        return self._build_path()
+
+    def keep_path(self):
+        """Keeps the path across repaints while the stroke is drawn."""
+        if self._path is None:
+            self._path = self._build_path()
+
+    def release_path(self):
+        self._path = None
+
+    def bounds(self):
+        """Tight QRect around the sample points (pen width not included)."""
+        if self._bounds is None:
+            xs = self.points[0::2]
+            ys = self.points[1::2]
+            self._bounds = QRect(QPoint(min(xs), min(ys)), QPoint(max(xs), max(ys)))
+        return QRect(self._bounds)
+
+    def segment_boxes(self):
+        """Yields (left, top, right, bottom) for every segment, or the lone point."""
+        pts = self.points
+        if len(pts) == 2:
+            yield (pts[0], pts[1], pts[0], pts[1])
+            return
+        for i in range(0, len(pts) - 2, 2):
+            x0, y0, x1, y1 = pts[i], pts[i + 1], pts[i + 2], pts[i + 3]
+            yield (min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1))
+
+    def hits(self, x, y, radius):
+        """True if (x, y) lies within `radius` of the polyline, not just of its samples."""
+        pts = self.points
+        r2 = radius * radius
+        if len(pts) == 2:
+            return segment_distance2(x, y, pts[0], pts[1], pts[0], pts[1]) < r2
+        for i in range(0, len(pts) - 2, 2):
+            if segment_distance2(x, y, pts[i], pts[i + 1], pts[i + 2], pts[i + 3]) < r2:
+                return True
+        return False
+
+    @property
+    def nbytes(self):
+        path_bytes = PATH_ELEMENT_BYTES * len(self) if self._path is not None else 0
+        return 128 + self.points.itemsize * len(self.points) + path_bytes
+
+
+class Shape:
+    """Rectangle, circle, line or arrow between two corner points."""
+    __slots__ = ("shape", "start", "end", "color", "size")
+    kind = "shape"
+
+    def __init__(self, shape, start, end, color, size):
+        self.shape = shape  # ShapeType
+        self.start = start
+        self.end = end
+        self.color = color
+        self.size = size
+
+    def rect(self):
+        return QRect(self.start, self.end).normalized()
+
+    def segment_boxes(self):
+        r = self.rect()
+        yield (r.left(), r.top(), r.right(), r.bottom())
+
+    @property
+    def nbytes(self):
+        return 128
@@ -0,0 +1,98 @@
+import logging
+import ollama
+from PyQt6.QtCore import QThread, pyqtSignal
+from .context_packer import context_window
+
+# Newest messages always sent verbatim, never folded into the summary
+KEEP_RECENT = 8
+# Summarise only once this many messages have aged out, so most turns cost nothing
+MIN_BATCH = 6
+# Per-message cap in the summarisation prompt
+MAX_MESSAGE_CHARS = 4000
+
+SUMMARY_PROMPT = """You maintain a running summary of a chat between a user and an AI assistant.
+Update the summary so it also covers the new messages. Keep facts, decisions, names, numbers,
+file and code details, and open questions; drop pleasantries. Reply with the summary only,
+at most about 300 words.
+
+CURRENT SUMMARY:
+{summary}
+
+NEW MESSAGES:
+{messages}"""
+
+
+def summary_messages(summary):
+    """History entries that stand in for the summarised part of a session."""
+    return [
+        {'role': 'user', 'text': f"Summary of our earlier conversation:\n{summary}", 'images': [], 'pinned': True},
+        {'role': 'model', 'text': "Understood, I'll keep that context in mind.", 'images': [], 'pinned': True},
+    ]
+
+
+class SessionSummarizer(QThread):
+    """
+    Folds messages that have aged out of the recent window into the
+    session's rolling summary. Each run only sends the previous summary
+    plus the newly aged messages, so the cost doesn't grow with the session.
+    """
+    summary_updated = pyqtSignal(int)  # session_id
+
+    def __init__(self, ai_client, db, session_id):
+        super().__init__()
+        self.ai_client = ai_client
+        self.db = db
+        self.session_id = session_id
+        # Captured now; the user may switch models while this runs
+        self.provider = ai_client.provider
+        self.model_name = ai_client.model_name
+
+    def pending_messages(self):
+        summary, through_id = self.db.get_summary(self.session_id)
+        messages = self.db.get_session_history(self.session_id)
+        aged = [m for m in messages[:-KEEP_RECENT] if m['id'] is not None and m['id'] > through_id]
+        return summary, aged
+
+    def run(self):
+        try:
+            summary, aged = self.pending_messages()
+            if len(aged) < MIN_BATCH:
+                return
+
+            lines = []
+            for msg in aged:
+                speaker = "AI" if msg['role'] == 'model' else "User"
+                text = msg['text'][:MAX_MESSAGE_CHARS]
+                if msg['image_path']:
+                    text += " [screenshot attached]"
+                lines.append(f"{speaker}: {text}")
+            prompt = SUMMARY_PROMPT.format(summary=summary or "(none yet)", messages="\n\n".join(lines))
+
+            updated = self.complete(prompt)
+            if not updated:
+                return
+            self.db.save_summary(self.session_id, updated.strip(), aged[-1]['id'])
+            logging.info(f"Session {self.session_id} summary now covers {aged[-1]['id']} "
+                         f"(+{len(aged)} messages, {len(updated)} chars)")
+            self.summary_updated.emit(self.session_id)
+        except Exception as e:
+            # The next finished turn simply retries
+            logging.warning(f"Summarizer Error: {e}")
+
+    def complete(self, prompt):
+        if self.provider == "gemini":
+            if not self.ai_client.gemini_client:
+                return None
+            response = self.ai_client.gemini_client.models.generate_content(
+                model=self.model_name,
+                contents=prompt
+            )
+            return response.text
+        elif self.provider == "ollama":
+            response = ollama.chat(
+                model=self.model_name,
+                messages=[{'role': 'user', 'content': prompt}],
+                options={'num_ctx': context_window("ollama", self.model_name)}
+            )
+            return response['message']['content']
+        return None
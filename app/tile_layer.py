@@ -0,0 +1,117 @@
+from PyQt6.QtCore import Qt
+from PyQt6.QtGui import QPainter, QPixmap
+
+
+class TiledLayer:
+    """
+    Raster cache for committed canvas items, split into fixed-size tiles.
+    A tile is only allocated once something is drawn on it, and each tile
+    keeps the ordered list of items intersecting it, so removing an item
+    re-renders just the tiles under that item's bounds.
+    """
+    def __init__(self, render_item, tile_size=256):
+        self.render_item = render_item  # callable(painter, item)
+        self.tile_size = tile_size
+        self.tiles = {}        # {(tx, ty): QPixmap}
+        self.tile_items = {}   # {(tx, ty): [item, ...]} in paint order
+        self.item_tiles = {}   # {id(item): [(tx, ty), ...]}
+        self.item_order = {}   # {id(item): n}, increases with every add
+        self.counter = 0
+
+    def _keys_for_rect(self, rect):
+        ts = self.tile_size
+        for tx in range(rect.left() // ts, rect.right() // ts + 1):
+            for ty in range(rect.top() // ts, rect.bottom() // ts + 1):
+                yield (tx, ty)
+
+    def _tile_painter(self, key, pixmap):
+        painter = QPainter(pixmap)
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+        # Items are stored in widget coordinates
+        painter.translate(-key[0] * self.tile_size, -key[1] * self.tile_size)
+        return painter
+
+    def _new_tile(self):
+        pixmap = QPixmap(self.tile_size, self.tile_size)
+        pixmap.fill(Qt.GlobalColor.transparent)
+        return pixmap
+
+    def add_item(self, item, bounds):
+        """Registers an item on every tile its bounds cover and paints it there."""
+        keys = list(self._keys_for_rect(bounds))
+        self.counter += 1
+        self.item_order[id(item)] = self.counter
+        self.item_tiles[id(item)] = keys
+        for key in keys:
+            self.tile_items.setdefault(key, []).append(item)
+            pixmap = self.tiles.get(key)
+            if pixmap is None:
+                pixmap = self._new_tile()
+                self.tiles[key] = pixmap
+            painter = self._tile_painter(key, pixmap)
+            self.render_item(painter, item)
+            painter.end()
+
+    def order_of(self, item):
+        return self.item_order.get(id(item), 0)
+
+    def snapshot(self):
+        """Returns (order, tiles) for a checkpoint. QPixmap copies are implicitly shared."""
+        return self.counter, {key: QPixmap(pixmap) for key, pixmap in self.tiles.items()}
+
+    def remove_items(self, items, checkpoint=None):
+        """
+        Drops items and re-renders only the tiles they were painted on.
+        With a checkpoint older than every removed item, each tile starts
+        from its checkpoint raster and only replays the items added since.
+        """
+        touched = set()
+        for item in items:
+            self.item_order.pop(id(item), None)
+            for key in self.item_tiles.pop(id(item), ()):
+                bucket = self.tile_items.get(key)
+                if bucket:
+                    bucket[:] = [other for other in bucket if other is not item]
+                touched.add(key)
+
+        for key in touched:
+            self._render_tile(key, checkpoint)
+
+    def _render_tile(self, key, checkpoint=None):
+        items = self.tile_items.get(key)
+        if not items:
+            # Nothing left on this tile, give the memory back
+            self.tile_items.pop(key, None)
+            self.tiles.pop(key, None)
+            return
+
+        if checkpoint is not None:
+            base = checkpoint.tiles.get(key)
+            pixmap = QPixmap(base) if base is not None else self._new_tile()
+            items = [item for item in items if self.item_order[id(item)] > checkpoint.order]
+        else:
+            pixmap = self.tiles.get(key)
+            if pixmap is None:
+                pixmap = self._new_tile()
+            else:
+                pixmap.fill(Qt.GlobalColor.transparent)
+        self.tiles[key] = pixmap
+
+        painter = self._tile_painter(key, pixmap)
+        for item in items:
+            self.render_item(painter, item)
+        painter.end()
+
+    def paint(self, painter, rect):
+        """Blits the allocated tiles overlapping rect (widget coordinates)."""
+        ts = self.tile_size
+        for key in self._keys_for_rect(rect):
+            pixmap = self.tiles.get(key)
+            if pixmap is not None:
+                painter.drawPixmap(key[0] * ts, key[1] * ts, pixmap)
+
+    def clear(self):
+        self.tiles.clear()
+        self.tile_items.clear()
+        self.item_tiles.clear()
+        self.item_order.clear()
@@ -7,6 +7,7 @@ class ToolMode(Enum):
     ERASE = auto()
     TEXT = auto()
     SHAPE = auto()
+    REGION = auto()
 
 class ShapeType(Enum):
     RECTANGLE = auto()
@@ -20,4 +21,12 @@ class ToolState:
         self.color = QColor(255, 255, 100) 
         self.brush_size = 4
         self.shape_type = ShapeType.RECTANGLE
-        self.active_textbox = None
\ No newline at end of file
+        self.active_textbox = None
+
+        # Freehand input cleanup (set either to 0 to disable)
+        self.decimate_distance = 1.0    # skip samples closer than this to the last kept one
+        self.simplify_tolerance = 0.75  # RDP tolerance in pixels, applied on release
+
+        # Capture cropping: a dragged region wins, else crop to the annotations
+        self.auto_crop = True
+        self.crop_margin = 48
@@ -0,0 +1,383 @@
+import math
+import itertools
+from collections import OrderedDict
+from PyQt6.QtWidgets import (
+    QListView, QStyledItemDelegate, QStyle, QAbstractItemView, QMenu, QApplication, QFrame
+)
+from PyQt6.QtCore import Qt, QAbstractListModel, QModelIndex, QRectF, QSize, QTimer, pyqtSignal
+from PyQt6.QtGui import (
+    QFont, QFontMetrics, QColor, QPainter, QPainterPath, QPen, QLinearGradient, QPixmap,
+    QImageReader, QTextDocument, QTextCursor, QPalette, QAbstractTextDocumentLayout, QKeySequence
+)
+
+# --- Bubble Geometry ---
+MARGIN_X = 16        # list edge to bubble
+MARGIN_Y = 6         # half the gap between bubbles
+PADDING_X = 12
+PADDING_Y = 10
+SPACING = 6          # image to text
+BUBBLE_SHARE = 0.7   # bubbles take 70% of the width, like the old 7:3 stretch
+RADIUS = 18
+IMAGE_WIDTH = 400
+
+DOCUMENT_CACHE_SIZE = 64   # laid-out documents kept around (visible rows plus a margin)
+PIXMAP_CACHE_SIZE = 32
+
+MessageRole = Qt.ItemDataRole.UserRole
+
+# Older pages are requested once the view is scrolled this close to the top
+FETCH_MARGIN = 200
+
+
+class TranscriptModel(QAbstractListModel):
+    """
+    Messages of the open session. Rows are plain dicts; `key` identifies a
+    row for the delegate's caches and `revision` bumps whenever its text grows.
+    """
+    text_appended = pyqtSignal(int, str)  # row key, appended text
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.messages = []
+        self._keys = itertools.count(1)
+
+    def _make_row(self, role, text, image_path=None, preview=None, message_id=None):
+        return {
+            'key': next(self._keys),
+            'id': message_id,
+            'role': role,
+            'text': text or "",
+            'image_path': image_path,
+            'preview': preview,
+            'revision': 0,
+        }
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.messages)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or index.row() >= len(self.messages):
+            return None
+        msg = self.messages[index.row()]
+        if role == Qt.ItemDataRole.DisplayRole:
+            return msg['text']
+        if role == MessageRole:
+            return msg
+        return None
+
+    def set_messages(self, messages):
+        """Replaces the transcript with rows from DatabaseManager.get_messages."""
+        self.beginResetModel()
+        self.messages = [
+            self._make_row(m['role'], m['text'], m.get('image_path'), message_id=m.get('id'))
+            for m in messages
+        ]
+        self.endResetModel()
+
+    def prepend_messages(self, messages):
+        """Inserts an older page above the current rows."""
+        if not messages:
+            return
+        rows = [self._make_row(m['role'], m['text'], m.get('image_path'), message_id=m.get('id'))
+                for m in messages]
+        self.beginInsertRows(QModelIndex(), 0, len(rows) - 1)
+        self.messages[:0] = rows
+        self.endInsertRows()
+
+    def append_message(self, role, text, image_path=None, preview=None, message_id=None):
+        """Adds a row at the end and returns its key (row numbers shift when pages are prepended)."""
+        row = len(self.messages)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.messages.append(self._make_row(role, text, image_path, preview, message_id))
+        self.endInsertRows()
+        return self.messages[row]['key']
+
+    def row_of(self, key):
+        # Rows being updated are nearly always the newest, so search from the end
+        for row in range(len(self.messages) - 1, -1, -1):
+            if self.messages[row]['key'] == key:
+                return row
+        return None
+
+    def append_text(self, key, text):
+        row = self.row_of(key)
+        if row is None:
+            return
+        msg = self.messages[row]
+        msg['text'] += text
+        msg['revision'] += 1
+        self.text_appended.emit(key, text)
+        index = self.index(row)
+        self.dataChanged.emit(index, index)
+
+    def remove(self, key):
+        row = self.row_of(key)
+        if row is not None:
+            self.beginRemoveRows(QModelIndex(), row, row)
+            del self.messages[row]
+            self.endRemoveRows()
+
+    def clear(self):
+        self.beginResetModel()
+        self.messages = []
+        self.endResetModel()
+
+
+class BubbleDelegate(QStyledItemDelegate):
+    """
+    Paints a message as a chat bubble. Rows without a laid-out document get a
+    cheap font-metrics height estimate; painting lays out the visible ones
+    and corrects their height, so only visible rows ever get a QTextDocument
+    or a decoded image. One height per row is cached for the current width.
+    """
+    def __init__(self, view):
+        super().__init__(view)
+        self.view = view
+        self.font = QFont("Segoe UI", 11)
+        self.metrics = QFontMetrics(self.font)
+        self.documents = OrderedDict()   # {key: QTextDocument}
+        self.pixmaps = OrderedDict()     # {key: scaled QPixmap}
+        self.image_sizes = {}            # {path: QSize}, header only
+        self.heights = {}                # {key: (revision, width, height, exact)}
+        self.remeasured = set()          # keys whose estimate painting corrected
+
+    def clear_caches(self):
+        self.documents.clear()
+        self.pixmaps.clear()
+        self.heights.clear()
+        self.remeasured.clear()
+
+    # --- Geometry ---
+    def _bubble_width(self):
+        return max(120, int((self.view.viewport().width() - 2 * MARGIN_X) * BUBBLE_SHARE))
+
+    def _image_size(self, msg, max_width):
+        """Displayed image size, or None when the row has no (readable) image."""
+        if msg['preview'] is not None:
+            size = msg['preview'].size()
+        elif msg['image_path']:
+            size = self.image_sizes.get(msg['image_path'])
+            if size is None:
+                size = QImageReader(msg['image_path']).size()
+                self.image_sizes[msg['image_path']] = size
+        else:
+            return None
+        if not size.isValid() or size.width() <= 0:
+            return None
+        width = min(IMAGE_WIDTH, max_width, size.width())
+        return QSize(width, max(1, round(size.height() * width / size.width())))
+
+    def _document(self, msg, text_width):
+        doc = self.documents.get(msg['key'])
+        if doc is None:
+            doc = QTextDocument()
+            doc.setUndoRedoEnabled(False)
+            doc.setDocumentMargin(0)
+            doc.setDefaultFont(self.font)
+            doc.setPlainText(msg['text'])
+            self.documents[msg['key']] = doc
+            while len(self.documents) > DOCUMENT_CACHE_SIZE:
+                self.documents.popitem(last=False)
+        else:
+            self.documents.move_to_end(msg['key'])
+        if doc.textWidth() != text_width:
+            doc.setTextWidth(text_width)
+        return doc
+
+    def append_text(self, key, text):
+        """Keeps a cached document in step with a streaming row, appending only the new text."""
+        doc = self.documents.get(key)
+        if doc is not None:
+            cursor = QTextCursor(doc)
+            cursor.movePosition(QTextCursor.MoveOperation.End)
+            cursor.insertText(text)
+
+    def _estimate_text_height(self, text, text_width):
+        """Wrapped height from average character width; no layout involved."""
+        chars_per_line = max(1, text_width // max(1, self.metrics.averageCharWidth()))
+        lines = sum(max(1, math.ceil(len(line) / chars_per_line)) for line in text.split("\n"))
+        return lines * self.metrics.lineSpacing()
+
+    def _row_height(self, msg, text_width, text_height):
+        height = 2 * MARGIN_Y + 2 * PADDING_Y + int(text_height) + 4
+        image = self._image_size(msg, text_width)
+        if image is not None:
+            height += image.height() + SPACING
+        return height
+
+    def sizeHint(self, option, index):
+        msg = index.data(MessageRole)
+        bubble_width = self._bubble_width()
+        cached = self.heights.get(msg['key'])
+        if cached is not None and cached[:2] == (msg['revision'], bubble_width):
+            return QSize(self.view.viewport().width(), cached[2])
+
+        text_width = bubble_width - 2 * PADDING_X
+        if msg['key'] in self.documents:
+            height, exact = self._row_height(msg, text_width, self._document(msg, text_width).size().height()), True
+        else:
+            # Off-screen rows (SinglePass sizes every row) are estimated; paint() corrects them
+            height, exact = self._row_height(msg, text_width, self._estimate_text_height(msg['text'], text_width)), False
+        self.heights[msg['key']] = (msg['revision'], bubble_width, height, exact)
+        return QSize(self.view.viewport().width(), height)
+
+    def _correct_height(self, msg, bubble_width, height):
+        """Stores a painted row's real height and relays it out if the estimate was off."""
+        cached = self.heights.get(msg['key'])
+        self.heights[msg['key']] = (msg['revision'], bubble_width, height, True)
+        if cached is None or cached[2] == height:
+            return
+        if not self.remeasured:
+            # sizeHintChanged can't be emitted from inside paint()
+            QTimer.singleShot(0, self._emit_remeasured)
+        self.remeasured.add(msg['key'])
+
+    def _emit_remeasured(self):
+        keys, self.remeasured = self.remeasured, set()
+        model = self.view.transcript
+        for key in keys:
+            row = model.row_of(key)
+            if row is not None:
+                self.sizeHintChanged.emit(model.index(row))
+
+    # --- Painting ---
+    def _pixmap(self, msg, size):
+        pixmap = self.pixmaps.get(msg['key'])
+        if pixmap is None or pixmap.width() != size.width():
+            source = msg['preview'] if msg['preview'] is not None else QPixmap(msg['image_path'])
+            if source.isNull():
+                return None
+            pixmap = source.scaledToWidth(size.width(), Qt.TransformationMode.SmoothTransformation)
+            self.pixmaps[msg['key']] = pixmap
+            while len(self.pixmaps) > PIXMAP_CACHE_SIZE:
+                self.pixmaps.popitem(last=False)
+        else:
+            self.pixmaps.move_to_end(msg['key'])
+        return pixmap
+
+    def paint(self, painter, option, index):
+        msg = index.data(MessageRole)
+        is_user = msg['role'] == 'user'
+        rect = option.rect
+        bubble_width = self._bubble_width()
+        text_width = bubble_width - 2 * PADDING_X
+
+        left = rect.right() - MARGIN_X - bubble_width if is_user else rect.left() + MARGIN_X
+        bubble = QRectF(left, rect.top() + MARGIN_Y, bubble_width, rect.height() - 2 * MARGIN_Y)
+
+        painter.save()
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+
+        path = QPainterPath()
+        path.addRoundedRect(bubble.adjusted(0.5, 0.5, -0.5, -0.5), RADIUS, RADIUS)
+        if is_user:
+            gradient = QLinearGradient(bubble.topLeft(), bubble.bottomRight())
+            gradient.setColorAt(0, QColor(90, 90, 95, 200))
+            gradient.setColorAt(1, QColor(110, 110, 115, 200))
+            painter.fillPath(path, gradient)
+            border = QColor(180, 180, 185, 50)
+        else:
+            painter.fillPath(path, QColor(55, 55, 60, 180))
+            border = QColor(150, 150, 155, 40)
+        if option.state & QStyle.StateFlag.State_Selected:
+            border = QColor(200, 200, 210, 140)
+        painter.setPen(QPen(border, 1))
+        painter.drawPath(path)
+
+        y = bubble.top() + PADDING_Y
+        image = self._image_size(msg, text_width)
+        if image is not None:
+            pixmap = self._pixmap(msg, image)
+            if pixmap is not None:
+                painter.drawPixmap(int(bubble.left() + PADDING_X), int(y), pixmap)
+            y += image.height() + SPACING
+
+        # Only the part of the document inside the viewport is drawn
+        doc = self._document(msg, text_width)
+        self._correct_height(msg, bubble_width, self._row_height(msg, text_width, doc.size().height()))
+        origin = QRectF(bubble.left() + PADDING_X, y, text_width, doc.size().height())
+        visible = QRectF(self.view.viewport().rect()).intersected(origin)
+        painter.translate(origin.topLeft())
+        context = QAbstractTextDocumentLayout.PaintContext()
+        context.palette.setColor(QPalette.ColorRole.Text,
+                                 QColor(255, 255, 255, 240) if is_user else QColor(240, 240, 255, 255))
+        context.clip = visible.translated(-origin.topLeft())
+        doc.documentLayout().draw(painter, context)
+        painter.restore()
+
+
+class TranscriptView(QListView):
+    """
+    The chat transcript: one list view whose widget count is the same for
+    five messages or five thousand. Emits near_top when the user scrolls
+    close to the oldest loaded row, so older pages can be fetched.
+    """
+    near_top = pyqtSignal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.transcript = TranscriptModel(self)
+        self.bubbles = BubbleDelegate(self)
+        self.setModel(self.transcript)
+        self.setItemDelegate(self.bubbles)
+        self.transcript.text_appended.connect(self._on_text_appended)
+        self.transcript.modelReset.connect(self.bubbles.clear_caches)
+
+        self.setFrameShape(QFrame.Shape.NoFrame)
+        self.setVerticalScrollMode(QAbstractItemView.ScrollMode.ScrollPerPixel)
+        self.setHorizontalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
+        self.setResizeMode(QListView.ResizeMode.Adjust)
+        self.setUniformItemSizes(False)
+        self.setSelectionMode(QAbstractItemView.SelectionMode.SingleSelection)
+        self.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
+        self.customContextMenuRequested.connect(self._show_context_menu)
+        self.verticalScrollBar().valueChanged.connect(self._on_scroll)
+        self._prepending = False
+
+    def _on_text_appended(self, key, text):
+        self.bubbles.append_text(key, text)
+        # A taller row needs the layout redone; heights of every other row are cached
+        row = self.transcript.row_of(key)
+        if row is not None:
+            self.bubbles.sizeHintChanged.emit(self.transcript.index(row))
+
+    def _on_scroll(self, value):
+        if not self._prepending and value <= FETCH_MARGIN and self.transcript.messages:
+            self.near_top.emit()
+
+    def is_scrollable(self):
+        return self.verticalScrollBar().maximum() > 0
+
+    def prepend_page(self, messages):
+        """Adds older messages above without moving what the user is looking at."""
+        bar = self.verticalScrollBar()
+        from_bottom = bar.maximum() - bar.value()
+        self._prepending = True
+        try:
+            self.transcript.prepend_messages(messages)
+            # Lay out now so the offset is known; existing rows are cached, new ones only estimated
+            self.executeDelayedItemsLayout()
+            bar.setValue(bar.maximum() - from_bottom)
+        finally:
+            self._prepending = False
+
+    def copy_selected(self):
+        index = self.currentIndex()
+        if index.isValid():
+            QApplication.clipboard().setText(index.data(Qt.ItemDataRole.DisplayRole))
+
+    def keyPressEvent(self, event):
+        if event.matches(QKeySequence.StandardKey.Copy):
+            self.copy_selected()
+            return
+        super().keyPressEvent(event)
+
+    def _show_context_menu(self, pos):
+        index = self.indexAt(pos)
+        if not index.isValid():
+            return
+        self.setCurrentIndex(index)
+        menu = QMenu(self)
+        menu.addAction("Copy message", self.copy_selected)
+        menu.exec(self.viewport().mapToGlobal(pos))
@@ -13,7 +13,7 @@ import logging
 
 # --- IMPORTS FROM YOUR MODULES ---
 from .painter import Painter
-from .capture import capture_screen_with_overlay
+from .capture import capture_screen_with_overlay, export_path, grab_screen
 from .tool_state import ToolState, ToolMode, ShapeType # <--- Fixed Import
 
 # --- CUSTOM UI WIDGETS ---
@@ -382,7 +382,7 @@ class CommandBar(QWidget):
 
 
 class GhostUI(QMainWindow):
-    capture_completed = pyqtSignal(str, str, list, str)
+    capture_completed = pyqtSignal(object, str, list, str)  # PendingCapture, prompt, files, model
 
     def __init__(self, ai_client=None):
         super().__init__()
@@ -394,6 +394,8 @@ class GhostUI(QMainWindow):
         self.textboxes = []
         self.painter = Painter(self, self.tool_state)
         self.last_mouse_pos = QPoint()
+        # Clean grab of the desktop taken just before the overlay is shown
+        self.frozen_frame = None
 
         self.showFullScreen()
         self.setMouseTracking(True)
@@ -417,8 +419,8 @@ class GhostUI(QMainWindow):
         # Toolbar (Top)
         self.toolbar = QWidget(self)
         self.toolbar.setObjectName("Toolbar")
-        self.toolbar.setFixedSize(540, 60)
-        self.toolbar.move((screen_geo.width() - 540) // 2, 30)
+        self.toolbar.setFixedSize(590, 60)
+        self.toolbar.move((screen_geo.width() - 590) // 2, 30)
 
         layout = QHBoxLayout(self.toolbar)
         layout.setContentsMargins(10, 10, 10, 10)
@@ -428,6 +430,7 @@ class GhostUI(QMainWindow):
         self.btn_erase = GlassButton("🧹", "Erase (E)")
         self.btn_shape = GlassButton("◼", "Shapes (S)")
         self.btn_text = GlassButton("📝", "Text (T)")
+        self.btn_region = GlassButton("⬚", "Capture Region (R)")
         
         self.btn_color = GlassButton("🎨", "Color (C)")
         self.btn_brush = GlassButton("●", "Brush Size (B)")
@@ -438,7 +441,7 @@ class GhostUI(QMainWindow):
         self.btn_close = GlassButton("✕", "Close (Esc)")
 
         buttons = [
-            self.btn_draw, self.btn_erase, self.btn_shape, self.btn_text,
+            self.btn_draw, self.btn_erase, self.btn_shape, self.btn_text, self.btn_region,
             self.btn_color, self.btn_brush, self.btn_clear,
             self.btn_undo, self.btn_redo, self.btn_export, self.btn_close
         ]
@@ -451,6 +454,7 @@ class GhostUI(QMainWindow):
         self.btn_erase.clicked.connect(self.enable_erase)
         self.btn_shape.clicked.connect(self.enable_shapes)
         self.btn_text.clicked.connect(self.add_new_textbox)
+        self.btn_region.clicked.connect(self.enable_region)
         
         self.btn_color.clicked.connect(self.pick_color)
         self.btn_brush.clicked.connect(self.toggle_brush_popover)
@@ -464,7 +468,10 @@ class GhostUI(QMainWindow):
         self.toolbar.show()
 
     def paintEvent(self, event):
+        # Live drawing only invalidates small rects, so honour event.rect()
+        dirty = event.rect()
         painter = QPainter(self)
+        painter.setClipRect(dirty)
         painter.setRenderHint(QPainter.RenderHint.Antialiasing)
         
         # Dim Background
@@ -472,14 +479,17 @@ class GhostUI(QMainWindow):
         gradient.setColorAt(0, QColor(30, 60, 150, 25))
         gradient.setColorAt(0.7, QColor(20, 40, 100, 15))
         gradient.setColorAt(1, QColor(10, 20, 50, 20))
-        painter.fillRect(self.rect(), gradient)
+        painter.fillRect(dirty, gradient)
         
         # Draw Toolbar Glass Background manually since it's just a QWidget
-        painter.save()
-        path = QPainterPath()
-        path.addRoundedRect(self.toolbar.geometry().toRectF(), 20, 20)
-        painter.fillPath(path, QColor(35, 35, 50, 160))
-        painter.restore()
+        if self.toolbar.geometry().intersects(dirty):
+            painter.save()
+            path = QPainterPath()
+            path.addRoundedRect(self.toolbar.geometry().toRectF(), 20, 20)
+            painter.fillPath(path, QColor(35, 35, 50, 160))
+            painter.restore()
+        # A widget can only have one active QPainter at a time
+        painter.end()
         
         # Draw Strokes
         self.painter.paint_event(event)
@@ -505,6 +515,12 @@ class GhostUI(QMainWindow):
         self.btn_shape.setChecked(True)
         self.toggle_shape_popover()
 
+    def enable_region(self):
+        self.tool_state.mode = ToolMode.REGION
+        self.setCursor(Qt.CursorShape.CrossCursor)
+        self.clear_checks()
+        self.btn_region.setChecked(True)
+
     def add_new_textbox(self):
         self.tool_state.mode = ToolMode.TEXT # <--- FIXED
         self.setCursor(Qt.CursorShape.IBeamCursor)
@@ -523,7 +539,7 @@ class GhostUI(QMainWindow):
             self.textboxes.remove(textbox)
 
     def clear_checks(self):
-        for b in [self.btn_draw, self.btn_erase, self.btn_text, self.btn_shape]:
+        for b in [self.btn_draw, self.btn_erase, self.btn_text, self.btn_shape, self.btn_region]:
             b.setChecked(False)
 
     def clear_all(self):
@@ -561,19 +577,33 @@ class GhostUI(QMainWindow):
         self.shape_popover.move(btn_pos.x() - 60, btn_pos.y() + 50)
         self.shape_popover.show()
 
-    def export_canvas(self):
-        # Hide UI so it doesn't appear in export
+    def show_with_frame(self):
+        """Freezes the current desktop, then shows the overlay over it."""
+        self.frozen_frame = grab_screen()
+        self.showFullScreen()
+
+    def _hide_chrome_for_live_grab(self):
+        # Only needed without a frozen frame: the UI must not end up in the grab
         self.toolbar.hide()
         self.command_bar.hide()
+        for b in self.textboxes:
+            b.delete_btn.hide()
         QApplication.processEvents()
+
+    def export_canvas(self):
+        live_grab = self.frozen_frame is None
+        if live_grab:
+            self._hide_chrome_for_live_grab()
         
         try:
-            # <--- FIXED: Pass 'self', not strokes list
-            path = capture_screen_with_overlay(self)
-            print(f"Canvas exported to: {path}")
+            # Exports go to a stable location, not the store that retention prunes
+            capture = capture_screen_with_overlay(self, self.frozen_frame, export_path())
+            logging.info(f"Canvas exporting to: {capture.path}")
         finally:
-            self.toolbar.show()
-            self.command_bar.show()
+            if live_grab:
+                self.toolbar.show()
+                self.command_bar.show()
+                self.showFullScreen()
 
     def submit_to_ai(self):
         if self._is_submitting:
@@ -591,27 +621,20 @@ class GhostUI(QMainWindow):
         self._is_submitting = True
         self.command_bar.btn_enter.setEnabled(False)
         
-        # 1. Hide UI
-        self.toolbar.hide()
-        self.command_bar.hide()
-        for b in self.textboxes: 
-            # We hide the delete button border, but keep text? 
-            # Actually, ResizableTextbox handles its own painting.
-            # We just need to make sure the delete button X isn't visible.
-            b.delete_btn.hide()
-            
-        QApplication.processEvents()
+        # 1. Hide UI (only when there is no frozen frame to composite onto)
+        if self.frozen_frame is None:
+            self._hide_chrome_for_live_grab()
         
         try:
             # 2. Capture (Fixed argument: pass self)
             logging.info("Calling capture_screen_with_overlay...")
-            path = capture_screen_with_overlay(self) 
-            logging.info(f"Capture returned path: {path}")
+            capture = capture_screen_with_overlay(self, self.frozen_frame)
+            logging.info(f"Capture queued for: {capture.path}")
             
             # 3. Close and Emit
             self.close()
-            logging.info(f"Emitting capture_completed signal with path: {path}")
-            self.capture_completed.emit(path, prompt, attached_files, selected_model)
+            logging.info(f"Emitting capture_completed signal with path: {capture.path}")
+            self.capture_completed.emit(capture, prompt, attached_files, selected_model)
         except Exception as e:
             logging.error(f"Error in submit_to_ai: {e}", exc_info=True)
         finally:
@@ -624,18 +647,19 @@ class GhostUI(QMainWindow):
         # Don't draw if clicking the toolbar
         if self.toolbar.geometry().contains(event.position().toPoint()):
             return
-        if self.tool_state.mode in (ToolMode.DRAW, ToolMode.ERASE, ToolMode.SHAPE):
+        if self.tool_state.mode in (ToolMode.DRAW, ToolMode.ERASE, ToolMode.SHAPE, ToolMode.REGION):
             self.painter.mouse_press(event)
 
     def mouseMoveEvent(self, event):
+        previous_pos = self.last_mouse_pos
         self.last_mouse_pos = event.position().toPoint()
-        if self.tool_state.mode in (ToolMode.DRAW, ToolMode.SHAPE, ToolMode.ERASE):
+        if self.tool_state.mode in (ToolMode.DRAW, ToolMode.SHAPE, ToolMode.ERASE, ToolMode.REGION):
             self.painter.mouse_move(event)
         if self.tool_state.mode == ToolMode.ERASE:
-            self.update()
+            self.painter.update_eraser_cursor(previous_pos, self.last_mouse_pos)
 
     def mouseReleaseEvent(self, event):
-        if self.tool_state.mode in (ToolMode.DRAW, ToolMode.SHAPE, ToolMode.ERASE):
+        if self.tool_state.mode in (ToolMode.DRAW, ToolMode.SHAPE, ToolMode.ERASE, ToolMode.REGION):
             self.painter.mouse_release(event)
 
     def keyPressEvent(self, event):
@@ -643,6 +667,7 @@ class GhostUI(QMainWindow):
         elif event.key() == Qt.Key.Key_E: self.enable_erase()
         elif event.key() == Qt.Key.Key_S and not event.modifiers(): self.enable_shapes()
         elif event.key() == Qt.Key.Key_T: self.add_new_textbox()
+        elif event.key() == Qt.Key.Key_R: self.enable_region()
         elif event.key() == Qt.Key.Key_C and not event.modifiers(): self.pick_color()
         elif event.key() == Qt.Key.Key_B: self.toggle_brush_popover()
         elif event.key() == Qt.Key.Key_Z and event.modifiers() == Qt.KeyboardModifier.ControlModifier: self.painter.undo()
@@ -653,4 +678,9 @@ class GhostUI(QMainWindow):
     def closeEvent(self, event):
         if self.brush_popover: self.brush_popover.close()
         if self.shape_popover: self.shape_popover.close()
-        super().closeEvent(event)
\ No newline at end of file
+        super().closeEvent(event)
+
+    def hideEvent(self, event):
+        # A multi-monitor grab is large; don't hold it while the overlay is away
+        self.frozen_frame = None
+        super().hideEvent(event)
\ No newline at end of file
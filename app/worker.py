@@ -1,8 +1,14 @@
 import os
 import time
+import base64
 import logging
 import ollama
 from PyQt6.QtCore import QThread, pyqtSignal
+from .capture import wait_for_capture
+from .image_prep import cached_payload
+from .retrieval import build_file_context
+from .context_packer import context_window, estimate_tokens, file_char_budget, pack_history
+from .response_cache import conversation_key, get_response_cache
 
 # Optional: Google GenAI types
 try:
@@ -10,33 +16,6 @@ try:
 except ImportError:
     types = None
 
-def read_file_content(path):
-    """Reads content from various file types for AI context."""
-    ext = os.path.splitext(path)[1].lower()
-    try:
-        if ext == '.pdf':
-            try:
-                from pypdf import PdfReader
-            except ImportError:
-                return "[Error: pypdf library not installed. Cannot read PDF.]"
-                
-            reader = PdfReader(path)
-            text = []
-            for page in reader.pages:
-                extracted = page.extract_text()
-                if extracted:
-                    text.append(extracted)
-            return "\n".join(text)
-            
-        elif ext in ['.txt', '.md', '.py', '.js', '.html', '.css', '.json', '.xml', '.yaml', '.cpp', '.h', '.docx']:
-            # Basic text reading
-            with open(path, 'r', encoding='utf-8', errors='ignore') as f:
-                return f.read()
-        else:
-            return f"[Unsupported file type: {ext}]"
-    except Exception as e:
-        return f"[Error reading {os.path.basename(path)}: {str(e)}]"
-
 class AIWorker(QThread):
     finished = pyqtSignal() 
     chunk_received = pyqtSignal(str)
@@ -47,29 +26,50 @@ class AIWorker(QThread):
         self.ai_client = ai_client
         self.history = history 
         self.attached_files = attached_files or []
+        self.response_parts = []
+
+    def emit_chunk(self, text):
+        self.response_parts.append(text)
+        self.chunk_received.emit(text)
 
     def run(self):
         try:
-            # --- PRODUCTION: Context Pruning ---
-            # To stay within free tier limits, send only instructions + last 10 messages
-            MAX_MESSAGES = 10
-            active_history = self.history
-            if len(self.history) > MAX_MESSAGES:
-                active_history = self.history[-MAX_MESSAGES:]
+            provider = self.ai_client.provider
+            model = self.ai_client.model_name
 
             # 1. Process Attached Files into context string
+            # Large files are indexed locally; only the chunks relevant to the query are sent
+            query = self.history[-1]['text'] if self.history else ""
             file_context = ""
-            for file_path in self.attached_files:
-                if os.path.exists(file_path):
-                    filename = os.path.basename(file_path)
-                    content = read_file_content(file_path)
-                    file_context += f"\n--- FILE: {filename} ---\n{content}\n"
+            if self.attached_files:
+                file_context = build_file_context(self.attached_files, query, file_char_budget(provider, model))
             
             if file_context:
                 logging.info(f"Generated file context length: {len(file_context)} chars")
             else:
                 logging.info("No file context generated.")
 
+            # --- PRODUCTION: Context Packing ---
+            # Newest messages first until the model's token budget is full
+            active_history, _ = pack_history(self.history, provider, model,
+                                             reserved=estimate_tokens(file_context))
+
+            # --- Response Cache (opt-in) ---
+            cache_key = None
+            if getattr(self.ai_client, "response_cache_enabled", False):
+                cache = get_response_cache()
+                cache_key = conversation_key(provider, model, active_history, self.attached_files)
+                cached = cache.get(cache_key)
+                if cached is not None:
+                    logging.info(f"Response cache hit ({cache.hits} hits / {cache.misses} misses)")
+                    # Same signals as a live stream, so the UI can't tell the difference
+                    for piece in cache.replay(cached):
+                        if self.isInterruptionRequested():
+                            return
+                        self.chunk_received.emit(piece)
+                    self.finished.emit()
+                    return
+
             # ==========================================
             # GEMINI PROVIDER (with Retry Logic)
             # ==========================================
@@ -97,16 +97,12 @@ class AIWorker(QThread):
                         images_list = msg.get('images', [])
                         
                         for img_path in images_list:
-                            if os.path.exists(img_path):
-                                with open(img_path, "rb") as f:
-                                    img_data = f.read()
-                                    # Detect mime type based on file extension
-                                    if img_path.lower().endswith('.png'):
-                                        mime_type = "image/png"
-                                    else:
-                                        mime_type = "image/jpeg"
-                                    
-                                    parts.append(types.Part.from_bytes(data=img_data, mime_type=mime_type))
+                            if wait_for_capture(img_path) and os.path.exists(img_path):
+                                # Downscaled to the model's budget, cheapest codec that keeps text legible
+                                parts.extend(cached_payload(
+                                    img_path, "gemini", self.ai_client.model_name,
+                                    lambda e: types.Part.from_bytes(data=e.data, mime_type=e.mime)
+                                ))
                         
                         gemini_contents.append(types.Content(role=msg['role'], parts=parts))
 
@@ -115,6 +111,7 @@ class AIWorker(QThread):
                 retry_delay = 5 # seconds
                 
                 for attempt in range(max_retries):
+                    self.response_parts = []
                     try:
                         response_stream = self.ai_client.gemini_client.models.generate_content_stream(
                             model=self.ai_client.model_name,
@@ -125,7 +122,7 @@ class AIWorker(QThread):
                             if self.isInterruptionRequested():
                                 return
                             if chunk.text:
-                                self.chunk_received.emit(chunk.text)
+                                self.emit_chunk(chunk.text)
                         
                         # If we reach here, the stream finished successfully
                         break 
@@ -160,15 +157,23 @@ class AIWorker(QThread):
                     role = 'assistant' if msg['role'] == 'model' else 'user'
                     message_dict = {'role': role, 'content': content}
                     
-                    valid_images = [img for img in msg['images'] if os.path.exists(img)]
+                    valid_images = [img for img in msg['images'] if wait_for_capture(img) and os.path.exists(img)]
                     if valid_images:
-                        message_dict['images'] = valid_images
+                        # Cached as base64 so the client doesn't re-encode every turn
+                        message_dict['images'] = [
+                            part
+                            for img in valid_images
+                            for part in cached_payload(img, "ollama", self.ai_client.model_name,
+                                                       lambda e: base64.b64encode(e.data).decode("ascii"))
+                        ]
                         
                     ollama_messages.append(message_dict)
 
+                # Without num_ctx Ollama silently truncates to its small default window
                 stream = ollama.chat(
                     model=self.ai_client.model_name,
                     messages=ollama_messages,
+                    options={'num_ctx': context_window("ollama", self.ai_client.model_name)},
                     stream=True
                 )
 
@@ -177,8 +182,10 @@ class AIWorker(QThread):
                         return
                     content = chunk.get('message', {}).get('content', '')
                     if content:
-                        self.chunk_received.emit(content)
+                        self.emit_chunk(content)
 
+            if cache_key and self.response_parts:
+                get_response_cache().put(cache_key, model, "".join(self.response_parts))
             self.finished.emit()
 
         except Exception as e:
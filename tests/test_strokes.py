@@ -0,0 +1,37 @@
+import pytest
+
+pytest.importorskip("PyQt6")
+
+from app.strokes import Stroke, segment_distance2
+
+
+def test_segment_distance_uses_closest_point_on_segment():
+    assert segment_distance2(50, 3, 0, 0, 100, 0) == 9
+    assert segment_distance2(-4, 3, 0, 0, 100, 0) == 25
+
+
+def test_simplified_straight_stroke_is_still_erasable_in_the_middle():
+    stroke = Stroke(None, 4, [v for i in range(201) for v in (100 + 3 * i, 200 + i // 20)])
+    stroke.simplify(0.75)
+    assert len(stroke) < 201
+
+    assert stroke.hits(400, 205, 16)
+    assert not stroke.hits(400, 260, 16)
+
+
+def test_single_point_stroke_hits_near_its_point():
+    stroke = Stroke(None, 4, [10, 10])
+    assert stroke.hits(12, 12, 4)
+    assert not stroke.hits(20, 20, 4)
+
+
+def test_only_a_stroke_being_drawn_keeps_its_path():
+    stroke = Stroke(None, 4, [0, 0, 10, 0, 20, 5])
+    stroke.keep_path()
+    stroke.append(30, 5)
+    assert stroke.path.elementCount() == 4
+    drawing = stroke.nbytes
+
+    stroke.release_path()
+    assert stroke.path.elementCount() == 4
+    assert stroke.nbytes < drawing